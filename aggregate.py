@@ -0,0 +1,183 @@
+"""
+Streaming aggregation of per-document metrics into per-dataset summaries.
+
+Metrics files are read as chunks of numeric columns, so aggregating a dataset
+takes constant memory however many documents it has.
+"""
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+# The per-document metrics that are averaged over the documents of a dataset.
+AVERAGED_METRICS = [
+    "compression",
+    "identifier_fertility",
+    "identifier_splitting_score",
+    "raw_identifier_splitting_score",
+    "token_span_score",
+]
+
+# The columns read from metrics files.
+COLUMNS = ["total_tokens", "total_bytes"] + AVERAGED_METRICS
+
+# The z-score of the two-sided 95% confidence intervals.
+Z_95 = 1.959963984540054
+
+
+@dataclass
+class RunningStats:
+    """The weighted mean and variance of a stream of values, updated a chunk
+    at a time with Chan et al.'s parallel algorithm, which stays accurate
+    where a sum of squares would cancel out."""
+
+    # The sum of the weights.
+    weight: float = 0.0
+
+    # The sum of the squared weights, which gives the effective sample size.
+    squared_weight: float = 0.0
+
+    # The weighted mean of the values.
+    mean: float = 0.0
+
+    # The weighted sum of squared differences from the mean.
+    m2: float = 0.0
+
+    def update(self, values: np.ndarray, weights: Optional[np.ndarray] = None):
+        """Adds a chunk of values, with a weight of 1 unless weights are
+        given."""
+        if weights is None:
+            weights = np.ones_like(values)
+
+        weight = float(weights.sum())
+        if weight == 0:
+            return
+
+        mean = float(np.dot(weights, values) / weight)
+        m2 = float(np.dot(weights, (values - mean) ** 2))
+
+        total_weight = self.weight + weight
+        delta = mean - self.mean
+        self.mean += delta * weight / total_weight
+        self.m2 += m2 + delta**2 * self.weight * weight / total_weight
+        self.weight = total_weight
+        self.squared_weight += float(np.dot(weights, weights))
+
+    def confidence_interval(self) -> Tuple[float, float]:
+        """Returns the normal-approximation 95% confidence interval of the
+        mean, using Kish's effective sample size for weighted values."""
+        if self.weight == 0:
+            return (math.nan, math.nan)
+
+        effective_size = self.weight**2 / self.squared_weight
+        if effective_size <= 1:
+            return (self.mean, self.mean)
+
+        # Unbiased (reliability-weighted) variance of the values.
+        variance = self.m2 / self.weight * effective_size / (effective_size - 1)
+        margin = Z_95 * math.sqrt(variance / effective_size)
+        return (self.mean - margin, self.mean + margin)
+
+
+def iter_metrics(path: str, block_size: int = 2**20) -> Iterator[pa.RecordBatch]:
+    """Yields the numeric columns of a metrics file in chunks. `path` is either a
+    directory of Parquet parts or a CSV file."""
+    if os.path.isdir(path):
+        for part in sorted(os.listdir(path)):
+            if part.endswith(".parquet"):
+                yield from pq.ParquetFile(os.path.join(path, part)).iter_batches(
+                    columns=COLUMNS
+                )
+        return
+
+    with pa_csv.open_csv(
+        path,
+        read_options=pa_csv.ReadOptions(block_size=block_size),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=COLUMNS,
+            column_types={"total_tokens": pa.int64(), "total_bytes": pa.int64()},
+        ),
+    ) as reader:
+        yield from reader
+
+
+def aggregate_metrics(batches: Iterator[pa.RecordBatch]) -> Dict:
+    """Aggregates the metrics of the documents of a dataset into their totals,
+    means and byte-weighted means, with 95% confidence intervals."""
+    documents = 0
+    total_tokens = 0
+    total_bytes = 0
+    stats = {metric: RunningStats() for metric in AVERAGED_METRICS}
+    byte_weighted_stats = {metric: RunningStats() for metric in AVERAGED_METRICS}
+
+    for batch in batches:
+        tokens = batch.column("total_tokens").to_numpy()
+        weights = batch.column("total_bytes").to_numpy().astype(np.float64)
+
+        documents += batch.num_rows
+        total_tokens += int(tokens.sum())
+        total_bytes += int(weights.sum())
+
+        for metric in AVERAGED_METRICS:
+            values = batch.column(metric).to_numpy().astype(np.float64)
+            stats[metric].update(values)
+            byte_weighted_stats[metric].update(values, weights)
+
+    return {
+        "documents": documents,
+        "total_tokens": total_tokens,
+        "total_bytes": total_bytes,
+        # Compression is reported over the whole dataset rather than averaged
+        # over documents.
+        "compression": total_bytes / total_tokens if total_tokens else math.nan,
+        **{
+            metric: stats[metric].mean
+            for metric in AVERAGED_METRICS
+            if metric != "compression"
+        },
+        "mean": {metric: stats[metric].mean for metric in AVERAGED_METRICS},
+        "ci95": {
+            metric: stats[metric].confidence_interval() for metric in AVERAGED_METRICS
+        },
+        "byte_weighted_mean": {
+            metric: byte_weighted_stats[metric].mean for metric in AVERAGED_METRICS
+        },
+        "byte_weighted_ci95": {
+            metric: byte_weighted_stats[metric].confidence_interval()
+            for metric in AVERAGED_METRICS
+        },
+    }
+
+
+def find_metrics(results: str) -> List[Tuple[str, str, str, str]]:
+    """Returns the language, model, dataset and path of every metrics file
+    under `results/<lang>/<model>/`, either a directory of Parquet parts or a
+    CSV file. A CSV file left by an older run is skipped when its dataset also
+    has a directory of Parquet parts."""
+    found = []
+    for lang in sorted(os.listdir(results)):
+        lang_dir = os.path.join(results, lang)
+        if not os.path.isdir(lang_dir):
+            continue
+
+        for model in sorted(os.listdir(lang_dir)):
+            model_dir = os.path.join(lang_dir, model)
+            if not os.path.isdir(model_dir):
+                continue
+
+            for entry in sorted(os.listdir(model_dir)):
+                path = os.path.join(model_dir, entry)
+                if entry.endswith(".csv"):
+                    dataset = entry.removesuffix(".csv")
+                    if not os.path.isdir(os.path.join(model_dir, dataset)):
+                        found.append((lang, model, dataset, path))
+                elif os.path.isdir(path):
+                    found.append((lang, model, entry, path))
+
+    return found
@@ -0,0 +1,135 @@
+import math
+import os
+
+import numpy as np
+
+from aggregate import (
+    Z_95,
+    RunningStats,
+    aggregate_metrics,
+    find_metrics,
+    iter_metrics,
+)
+from metrics_sink import MetricsSink
+from token_score import TokenScoreMetrics
+
+
+def test_running_stats():
+    rng = np.random.default_rng(0)
+    values = rng.normal(3, 2, size=10_000)
+    weights = rng.integers(1, 1000, size=10_000).astype(np.float64)
+
+    stats = RunningStats()
+    weighted_stats = RunningStats()
+    for chunk in range(0, len(values), 777):
+        stats.update(values[chunk : chunk + 777])
+        weighted_stats.update(values[chunk : chunk + 777], weights[chunk : chunk + 777])
+
+    assert math.isclose(stats.mean, values.mean())
+    margin = Z_95 * values.std(ddof=1) / math.sqrt(len(values))
+    low, high = stats.confidence_interval()
+    assert math.isclose(low, values.mean() - margin)
+    assert math.isclose(high, values.mean() + margin)
+
+    assert math.isclose(weighted_stats.mean, np.average(values, weights=weights))
+    low, high = weighted_stats.confidence_interval()
+    assert low < weighted_stats.mean < high
+
+
+def test_aggregate_metrics(tmp_path):
+    rows = [
+        TokenScoreMetrics(
+            compression=(i % 7) / 2,
+            identifier_fertility=1 + (i % 3),
+            identifier_splitting_score=(i % 5) / 4,
+            raw_identifier_splitting_score=(i % 4) / 4,
+            token_span_score=1 + (i % 2),
+            total_tokens=10 + i,
+            total_bytes=30 + 2 * i,
+        )
+        for i in range(1000)
+    ]
+
+    results = str(tmp_path)
+    with MetricsSink(results, "dataset", ["model"], batch_size=64) as sink:
+        for i, metrics in enumerate(rows):
+            sink.write(f"python/{i}", "python", "model", metrics)
+
+    csv_path = os.path.join(results, "go", "model", "dataset.csv")
+    os.makedirs(os.path.dirname(csv_path))
+    with open(csv_path, "w") as f:
+        f.write(
+            "total_tokens,total_bytes,compression,token_span_score,raw_identifier_splitting_score,identifier_splitting_score,identifier_fertility\n"
+        )
+        for m in rows:
+            f.write(
+                f"{m.total_tokens},{m.total_bytes},{m.compression},{m.token_span_score},{m.raw_identifier_splitting_score},{m.identifier_splitting_score},{m.identifier_fertility}\n"
+            )
+
+    found = find_metrics(results)
+    assert [(lang, model, dataset) for lang, model, dataset, _ in found] == [
+        ("go", "model", "dataset"),
+        ("python", "model", "dataset"),
+    ]
+
+    csv_aggregate, parquet_aggregate = [
+        aggregate_metrics(iter_metrics(path, block_size=4096))
+        for _, _, _, path in found
+    ]
+
+    assert csv_aggregate["documents"] == parquet_aggregate["documents"] == 1000
+    assert csv_aggregate["total_bytes"] == sum(m.total_bytes for m in rows)
+    assert math.isclose(
+        csv_aggregate["compression"],
+        sum(m.total_bytes for m in rows) / sum(m.total_tokens for m in rows),
+    )
+    assert math.isclose(
+        csv_aggregate["token_span_score"],
+        sum(m.token_span_score for m in rows) / len(rows),
+    )
+    assert math.isclose(
+        csv_aggregate["byte_weighted_mean"]["identifier_fertility"],
+        sum(m.identifier_fertility * m.total_bytes for m in rows)
+        / sum(m.total_bytes for m in rows),
+    )
+
+    for key in ["mean", "byte_weighted_mean"]:
+        for metric, value in csv_aggregate[key].items():
+            assert math.isclose(value, parquet_aggregate[key][metric])
+
+
+def test_find_metrics_skips_other_csvs(tmp_path):
+    results = str(tmp_path)
+    with MetricsSink(results, "dataset", ["model"]) as sink:
+        sink.write(
+            "python/0",
+            "python",
+            "model",
+            TokenScoreMetrics(
+                compression=3,
+                identifier_fertility=1,
+                identifier_splitting_score=1,
+                raw_identifier_splitting_score=1,
+                token_span_score=1,
+                total_tokens=10,
+                total_bytes=30,
+            ),
+        )
+
+    # A CSV left by an older run over the same dataset.
+    with open(os.path.join(results, "python", "model", "dataset.csv"), "w") as f:
+        f.write("total_tokens,total_bytes\n")
+
+    # The timeouts log of evaluate_the_stack.py, next to the metrics.
+    os.makedirs(os.path.join(results, "timeouts"))
+    with open(os.path.join(results, "timeouts", "dataset--model.csv"), "w") as f:
+        f.write("doc_id,lang,total_bytes,stage\n")
+
+    assert find_metrics(results) == [
+        (
+            "python",
+            "model",
+            "dataset",
+            os.path.join(results, "python", "model", "dataset"),
+        )
+    ]
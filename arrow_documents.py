@@ -0,0 +1,72 @@
+"""
+Zero-copy access to the content of documents stored in Arrow tables.
+
+Hugging Face datasets keep their rows in memory-mapped Arrow files, so a forked
+worker can read any document straight from the page cache. Tasks then only
+need to name a row rather than carry its content through a pipe.
+"""
+
+from bisect import bisect_right
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+class ArrowDocuments:
+    """The string or binary column of the documents of several Arrow tables,
+    the shards, addressed by shard and row."""
+
+    def __init__(self, tables: Sequence[pa.Table], column: str = "content"):
+        self.columns = [table.column(column) for table in tables]
+
+        # The first row of each chunk of each shard.
+        self.chunk_starts = [
+            np.cumsum([0] + [len(chunk) for chunk in column.chunks]).tolist()
+            for column in self.columns
+        ]
+
+        # The offsets and data buffers of the chunks read so far, keyed by
+        # shard and chunk.
+        self.buffers: Dict[Tuple[int, int], Tuple[np.ndarray, pa.Buffer]] = {}
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def sizes(self, shard: int) -> np.ndarray:
+        """Returns the size in bytes of every document of a shard."""
+        return (
+            pc.binary_length(self.columns[shard])
+            .fill_null(0)
+            .to_numpy()
+            .astype(np.int64)
+        )
+
+    def content(self, shard: int, row: int) -> memoryview:
+        """Returns the content of a document as a view of the table's memory.
+        Null documents are empty."""
+        chunk_index = bisect_right(self.chunk_starts[shard], row) - 1
+        chunk = self.columns[shard].chunk(chunk_index)
+        row -= self.chunk_starts[shard][chunk_index]
+
+        if chunk.null_count and not chunk[row].is_valid:
+            return memoryview(b"")
+
+        buffers = self.buffers.get((shard, chunk_index))
+        if buffers is None:
+            _, offsets, data = chunk.buffers()
+            offset_type = (
+                np.int64
+                if pa.types.is_large_string(chunk.type)
+                or pa.types.is_large_binary(chunk.type)
+                else np.int32
+            )
+            buffers = self.buffers[(shard, chunk_index)] = (
+                np.frombuffer(offsets, dtype=offset_type),
+                data,
+            )
+
+        offsets, data = buffers
+        row += chunk.offset
+        return memoryview(data)[offsets[row] : offsets[row + 1]]
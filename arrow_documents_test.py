@@ -0,0 +1,36 @@
+import pyarrow as pa
+
+from arrow_documents import ArrowDocuments
+
+
+def test_arrow_documents():
+    first = pa.table({"content": ["def f():\n", None, "é", ""]})
+    # A shard of several chunks, one of them a slice of a larger array.
+    second = pa.Table.from_batches(
+        [
+            pa.record_batch([pa.array(["a", "bb"], pa.large_string())], ["content"]),
+            pa.record_batch(
+                [pa.array(["x", "ccc", "dddd"], pa.large_string()).slice(1)],
+                ["content"],
+            ),
+        ]
+    )
+
+    documents = ArrowDocuments([first, second])
+
+    assert len(documents) == 2
+    assert documents.sizes(0).tolist() == [9, 0, 2, 0]
+    assert documents.sizes(1).tolist() == [1, 2, 3, 4]
+
+    assert [bytes(documents.content(0, row)) for row in range(4)] == [
+        b"def f():\n",
+        b"",
+        "é".encode(),
+        b"",
+    ]
+    assert [bytes(documents.content(1, row)) for row in range(4)] == [
+        b"a",
+        b"bb",
+        b"ccc",
+        b"dddd",
+    ]
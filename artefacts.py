@@ -0,0 +1,181 @@
+"""
+A content-addressed, on-disk store of the syntax artefacts of documents.
+
+Parsing a document and splitting its identifiers doesn't depend on the
+tokenizer, so evaluating several tokenizers over the same dataset only needs to
+do it once. The first run stores the artefacts of every document and later runs
+memory-map them, leaving tokenization and scoring as the only per-tokenizer
+work.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from importlib.metadata import PackageNotFoundError, version
+from typing import Optional
+
+from token_score import (
+    Deadline,
+    Document,
+    SyntaxArtefacts,
+    TokenArray,
+    compute_syntax_artefacts,
+)
+
+# Bumped whenever the file format or the content of the artefacts changes, so
+# that stale artefacts are never read back.
+FORMAT_VERSION = 1
+
+# Artefact files start with the magic, the number of identifiers, the number
+# of syntax tokens and the length of the JSON metadata.
+HEADER = struct.Struct("<4sIII")
+MAGIC = b"TSA1"
+
+
+def grammar_version() -> str:
+    """Returns the version of the tree-sitter grammars, which determine the
+    content of the artefacts."""
+    try:
+        return version("tree_sitter_languages")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+class ArtefactStore:
+    """A directory of syntax artefacts keyed by a hash of the document's
+    language and content.
+
+    Each document's artefacts live in their own file. The file holds a small
+    JSON blob with the interned type names and the authoritative splits,
+    followed by the identifier and syntax token columns as raw arrays, which
+    are memory-mapped when read back."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.salt = f"{FORMAT_VERSION}:{grammar_version()}".encode()
+
+    def key(self, document: Document) -> str:
+        """Returns the key of the document's artefacts."""
+        h = hashlib.sha256(self.salt)
+        h.update(document.lang.encode())
+        h.update(b"\0")
+        h.update(document.content)
+        return h.hexdigest()
+
+    def path_for(self, key: str) -> str:
+        """Returns the path of the artefact file for a key."""
+        return os.path.join(self.path, key[:2], f"{key}.bin")
+
+    def get(self, document: Document) -> Optional[SyntaxArtefacts]:
+        """Returns the stored artefacts of the document, if any."""
+        try:
+            with open(self.path_for(self.key(document)), "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            # mmap raises a ValueError on empty files.
+            return None
+
+        return decode_artefacts(buffer)
+
+    def put(self, document: Document, artefacts: SyntaxArtefacts):
+        """Stores the artefacts of the document. Files are written atomically
+        so that concurrent workers never observe a partial file."""
+        path = self.path_for(self.key(document))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(encode_artefacts(artefacts))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def get_or_compute(
+        self, document: Document, deadline: Optional[Deadline] = None
+    ) -> SyntaxArtefacts:
+        """Returns the stored artefacts of the document, computing and storing
+        them if they are missing."""
+        artefacts = self.get(document)
+        if artefacts is None:
+            artefacts = compute_syntax_artefacts(document, deadline=deadline)
+            self.put(document, artefacts)
+        return artefacts
+
+
+def encode_artefacts(artefacts: SyntaxArtefacts) -> bytes:
+    """Serializes syntax artefacts."""
+    identifiers = artefacts.identifiers
+    syntax_tokens = artefacts.syntax_tokens
+
+    metadata = json.dumps(
+        {
+            "identifier_types": identifiers.type_names,
+            "syntax_token_types": syntax_tokens.type_names,
+            "authoritative_splits": artefacts.authoritative_splits,
+        }
+    ).encode()
+    # Pad the metadata so that the offset columns are aligned.
+    metadata += b" " * (-len(metadata) % 4)
+
+    return b"".join(
+        [
+            HEADER.pack(MAGIC, len(identifiers), len(syntax_tokens), len(metadata)),
+            metadata,
+            array("I", identifiers.starts).tobytes(),
+            array("I", identifiers.ends).tobytes(),
+            array("I", syntax_tokens.starts).tobytes(),
+            array("I", syntax_tokens.ends).tobytes(),
+            array("H", identifiers.types).tobytes(),  # type: ignore
+            array("H", syntax_tokens.types).tobytes(),  # type: ignore
+        ]
+    )
+
+
+def decode_artefacts(buffer) -> SyntaxArtefacts:
+    """Deserializes syntax artefacts. The offset and type columns are
+    zero-copy views over the buffer."""
+    magic, num_identifiers, num_syntax_tokens, metadata_len = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f"Not a syntax artefacts file: {magic!r}")
+
+    view = memoryview(buffer)
+    offset = HEADER.size
+
+    metadata = json.loads(bytes(view[offset : offset + metadata_len]))
+    offset += metadata_len
+
+    def column(typecode: str, length: int) -> memoryview:
+        nonlocal offset
+        size = length * array(typecode).itemsize
+        col = view[offset : offset + size].cast(typecode)
+        offset += size
+        return col
+
+    identifier_starts = column("I", num_identifiers)
+    identifier_ends = column("I", num_identifiers)
+    syntax_token_starts = column("I", num_syntax_tokens)
+    syntax_token_ends = column("I", num_syntax_tokens)
+    identifier_types = column("H", num_identifiers)
+    syntax_token_types = column("H", num_syntax_tokens)
+
+    return SyntaxArtefacts(
+        identifiers=TokenArray.from_columns(
+            identifier_starts,
+            identifier_ends,
+            identifier_types,
+            metadata["identifier_types"],
+        ),
+        syntax_tokens=TokenArray.from_columns(
+            syntax_token_starts,
+            syntax_token_ends,
+            syntax_token_types,
+            metadata["syntax_token_types"],
+        ),
+        authoritative_splits=metadata["authoritative_splits"],
+    )
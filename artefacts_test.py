@@ -0,0 +1,37 @@
+from artefacts import ArtefactStore, decode_artefacts, encode_artefacts
+from token_score import Document, compute_syntax_artefacts, compute_token_score
+from token_score_test import load_snippets, random_tokens
+
+
+def test_encode_artefacts():
+    for document in load_snippets():
+        artefacts = compute_syntax_artefacts(document)
+        decoded = decode_artefacts(encode_artefacts(artefacts))
+
+        assert decoded.identifiers == artefacts.identifiers
+        assert decoded.syntax_tokens == artefacts.syntax_tokens
+        assert decoded.authoritative_splits == artefacts.authoritative_splits
+
+
+def test_artefact_store(tmp_path):
+    store = ArtefactStore(str(tmp_path))
+
+    for document in load_snippets():
+        assert store.get(document) is None
+
+        artefacts = store.get_or_compute(document)
+        stored = store.get(document)
+
+        assert stored is not None
+        assert stored.identifiers == artefacts.identifiers
+        assert stored.syntax_tokens == artefacts.syntax_tokens
+
+        tokens = random_tokens(document.content, seed=0)
+
+        assert (
+            compute_token_score(document, tokens, artefacts=stored).metrics
+            == compute_token_score(document, tokens).metrics
+        )
+
+    # Documents are keyed by language as well as content.
+    assert store.get(Document(lang="go", content=document.content)) is None
@@ -0,0 +1,223 @@
+"""
+Micro-benchmarks for the stages of the token score pipeline, run over
+synthetic documents built by repeating the examples under `snippets/`.
+"""
+
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from token_score import (
+    ENGINES,
+    Document,
+    TokenArray,
+    collect_identifiers,
+    collect_syntax_tokens,
+    compute_identifier_splitting_score,
+    compute_token_span_score,
+)
+
+SNIPPETS = {
+    "c++": ".cpp",
+    "go": ".go",
+    "java": ".java",
+    "javascript": ".js",
+    "python": ".py",
+}
+
+
+def synthetic_document(lang: str, size: int) -> Document:
+    """Returns a document of at least `size` bytes made of repeated
+    snippets."""
+    with open(f"snippets/{SNIPPETS[lang]}", "rb") as f:
+        snippet = f.read()
+    return Document(lang=lang, content=snippet * (size // len(snippet) + 1))
+
+
+def nested_document(depth: int) -> Document:
+    """Returns a JavaScript document made of a single array literal nested
+    `depth` times, like generated code or serialized data."""
+    return Document(
+        lang="javascript", content=b"x = " + b"[" * depth + b"1" + b"]" * depth + b";"
+    )
+
+
+def minified_document(size: int) -> Document:
+    """Returns a JavaScript document of at least `size` bytes on a single line,
+    like the output of a minifier."""
+    content = synthetic_document("javascript", size).content
+    content = re.sub(rb"(?m)^\s*//.*$", b"", content)
+    return Document(lang="javascript", content=re.sub(rb"\s+", b" ", content))
+
+
+def synthetic_tokens(document: Document, max_token_bytes: int = 4) -> TokenArray:
+    """Splits the document into words, whitespace runs and punctuation, then
+    chops those into tokens of at most `max_token_bytes` bytes, which is close
+    to the compression of real code tokenizers."""
+    tokens = TokenArray()
+    for match in re.finditer(rb"\w+|\s+|[^\w\s]", document.content):
+        for start in range(match.start(), match.end(), max_token_bytes):
+            tokens.append(start, min(start + max_token_bytes, match.end()))
+    return tokens
+
+
+def benchmark_token_span_score(args: argparse.Namespace):
+    print(
+        f"{'size (MB)':>10} {'tokens':>10} {'syntax tokens':>14} {'time (s)':>10} {'s/MB':>8}"
+    )
+
+    for size in args.sizes:
+        document = synthetic_document(args.lang, int(size * 2**20))
+        syntax_tokens = collect_syntax_tokens(document.parse(), document.content)
+        tokens = synthetic_tokens(document)
+
+        start = time.perf_counter()
+        compute_token_span_score(syntax_tokens, tokens, args.engine)
+        elapsed = time.perf_counter() - start
+
+        print(
+            f"{size:>10} {len(tokens):>10} {len(syntax_tokens):>14} {elapsed:>10.3f} {elapsed / size:>8.3f}"
+        )
+
+
+def benchmark_engines(args: argparse.Namespace):
+    document = synthetic_document(args.lang, int(args.size * 2**20))
+    tree = document.parse()
+    syntax_tokens = collect_syntax_tokens(tree, document.content)
+    identifiers = collect_identifiers(tree, document)
+    tokens = synthetic_tokens(document)
+
+    print(f"{'engine':>8} {'span score (s)':>15} {'identifier splitting (s)':>25}")
+
+    for engine in sorted(ENGINES):
+        start = time.perf_counter()
+        compute_token_span_score(syntax_tokens, tokens, engine)
+        span_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        # As in the workers, which only keep the metrics.
+        compute_identifier_splitting_score(
+            document, identifiers, tokens, engine, return_identifier_splits=False
+        )
+        identifier_elapsed = time.perf_counter() - start
+
+        print(f"{engine:>8} {span_elapsed:>15.3f} {identifier_elapsed:>25.3f}")
+
+
+def benchmark_syntax_tokens(args: argparse.Namespace):
+    documents = [(f"nested {depth}", nested_document(depth)) for depth in args.depths]
+    documents += [
+        (f"minified {size} MB", minified_document(int(size * 2**20)))
+        for size in args.sizes
+    ]
+
+    print(
+        f"{'document':>18} {'syntax tokens':>14} {'parse (s)':>10} {'collect (s)':>12}"
+    )
+
+    for name, document in documents:
+        start = time.perf_counter()
+        tree = document.parse()
+        parse_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        syntax_tokens = collect_syntax_tokens(tree, document.content)
+        collect_elapsed = time.perf_counter() - start
+
+        print(
+            f"{name:>18} {len(syntax_tokens):>14} {parse_elapsed:>10.3f} {collect_elapsed:>12.3f}"
+        )
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Imports the module in a fresh interpreter and returns the cumulative
+    import time of every module it imported, in microseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    times = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        # Only keep the module itself and the modules it imports directly.
+        if match and len(match.group(2)) <= 3:
+            times[match.group(3)] = int(match.group(1))
+    return times
+
+
+def benchmark_import_time(args: argparse.Namespace):
+    for module in args.modules:
+        runs = [import_times(module) for _ in range(args.runs)]
+        total = statistics.median(run[module] for run in runs) / 1e3
+
+        print(f"{module}: {total:.1f} ms (median of {args.runs} runs)")
+
+        imports = sorted(
+            (name for name in runs[-1] if name != module),
+            key=lambda name: runs[-1][name],
+            reverse=True,
+        )
+        for name in imports[: args.top]:
+            print(f"  {name:<40} {runs[-1][name] / 1e3:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    sp = p.add_subparsers(dest="benchmark", required=True)
+
+    span = sp.add_parser("span", help="Token span score over growing documents")
+    span.add_argument("--lang", default="python", choices=sorted(SNIPPETS))
+    span.add_argument(
+        "--sizes",
+        type=float,
+        nargs="+",
+        default=[1, 2, 4, 8],
+        help="Document sizes in MB",
+    )
+    span.add_argument("--engine", default="python", choices=sorted(ENGINES))
+    span.set_defaults(func=benchmark_token_span_score)
+
+    engines = sp.add_parser("engines", help="Compare the scoring engines")
+    engines.add_argument("--lang", default="python", choices=sorted(SNIPPETS))
+    engines.add_argument("--size", type=float, default=1, help="Document size in MB")
+    engines.set_defaults(func=benchmark_engines)
+
+    syntax = sp.add_parser(
+        "syntax", help="Syntax token collection over nested and minified documents"
+    )
+    syntax.add_argument(
+        "--depths",
+        type=int,
+        nargs="+",
+        default=[100, 1000, 10000, 100000],
+        help="Nesting depths of the nested documents",
+    )
+    syntax.add_argument(
+        "--sizes",
+        type=float,
+        nargs="+",
+        default=[1, 4],
+        help="Sizes of the minified documents in MB",
+    )
+    syntax.set_defaults(func=benchmark_syntax_tokens)
+
+    importtime = sp.add_parser(
+        "importtime", help="Startup cost of importing the library and the scripts"
+    )
+    importtime.add_argument(
+        "--modules", nargs="+", default=["token_score", "evaluate_snippet"]
+    )
+    importtime.add_argument("--runs", type=int, default=5)
+    importtime.add_argument(
+        "--top", type=int, default=5, help="Number of heaviest imports to show"
+    )
+    importtime.set_defaults(func=benchmark_import_time)
+
+    args = p.parse_args()
+    args.func(args)
@@ -1,76 +1,161 @@
-import json
-from typing import Dict, List
+import argparse
+import functools
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Tuple
 
+import numpy as np
 from datasets import load_dataset
 from tiktoken import encoding_for_model
 from tqdm import tqdm
 from transformers import AutoTokenizer
 
+from token_frequencies import (
+    count_tokens,
+    counted_shards,
+    encode_batch,
+    mask_counts,
+    merge_counts,
+    save_counts,
+    save_shard_counts,
+    vocabulary_size,
+)
+
 HF_TOKENIZER_NAMES = [
     "replit/replit-code-v1_5-3b",
     "stabilityai/stable-code-3b",
     "codellama/CodeLlama-7b-hf",
 ]
 
-HF_TOKENIZERS = [
-    AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
-    for model_name in HF_TOKENIZER_NAMES
-]
-
 OPENAI_TOKENIZER_NAMES = [
     "code-cushman-001",
     "gpt-4",
 ]
 
-OPENAI_TOKENIZERS = [
-    encoding_for_model(model_name) for model_name in OPENAI_TOKENIZER_NAMES
-]
+OUTDIR = "results/token-frequencies"
+
+BATCH_SIZE = 256
+
+
+@functools.lru_cache(maxsize=None)
+def load_tokenizers() -> Dict[str, Tuple[str, object]]:
+    """Returns each tokenizer with its library, keyed by its name. Tokenizers
+    are loaded once per process."""
+    return {
+        **{
+            name: ("hf", AutoTokenizer.from_pretrained(name, trust_remote_code=True))
+            for name in HF_TOKENIZER_NAMES
+        },
+        **{
+            name: ("tiktoken", encoding_for_model(name))
+            for name in OPENAI_TOKENIZER_NAMES
+        },
+    }
+
+
+def count_shard(shard: int, num_shards: int) -> int:
+    """Counts the tokens of a contiguous shard of the dataset and saves their
+    raw counts, returning the shard."""
+    tokenizers = load_tokenizers()
+
+    # For each tokeniser, the number of occurrences of each token, indexed by
+    # token ID.
+    r: Dict[str, np.ndarray] = {
+        name: np.zeros(vocabulary_size(lib, tokenizer), dtype=np.int64)
+        for name, (lib, tokenizer) in tokenizers.items()
+    }
+
+    def count_batch(name: str, contents: List[str]):
+        lib, tokenizer = tokenizers[name]
+        count_tokens(r[name], encode_batch(lib, tokenizer, contents))
+
+    ds = load_dataset("bigcode/the-stack-smol", split="train")
+    ds = ds.shard(num_shards=num_shards, index=shard, contiguous=True)  # type: ignore
+
+    # Tokenizers release the GIL while encoding, so each batch is counted for
+    # every tokenizer in parallel.
+    with ThreadPoolExecutor(max_workers=len(tokenizers)) as executor:
+        for samples in tqdm(
+            ds.iter(batch_size=BATCH_SIZE),
+            total=-(-len(ds) // BATCH_SIZE),
+            desc=f"Shard {shard}",
+        ):
+            contents = samples["content"]
+            for future in [
+                executor.submit(count_batch, name, contents) for name in tokenizers
+            ]:
+                future.result()
 
+    save_shard_counts(OUTDIR, shard, num_shards, r)
+    return shard
 
-def batched_dataset(batch_size):
-    batch = []
-    for sample in tqdm(load_dataset("bigcode/the-stack-smol", split="train")):
-        batch.append(sample)
-        if len(batch) == batch_size:
-            yield batch
-            batch = []
-    if len(batch) > 0:
-        yield batch
-
-
-# For each tokeniser, mapping from token ID to number of occurrences for that
-# token.
-r: Dict[str, Dict[int, int]] = {
-    name: {} for name in HF_TOKENIZER_NAMES + OPENAI_TOKENIZER_NAMES
-}
-
-for samples in batched_dataset(256):
-    contents = [sample["content"] for sample in samples]
-
-    for name, tokenizer in zip(HF_TOKENIZER_NAMES, HF_TOKENIZERS):
-        ids: List[List[int]] = tokenizer.batch_encode_plus(
-            contents, add_special_tokens=False, return_attention_mask=False
-        )["input_ids"]  # type: ignore
-        for s in ids:
-            for id in s:
-                if id not in r[name]:
-                    r[name][id] = 0
-                r[name][id] += 1
-
-    for name, tokenizer in zip(OPENAI_TOKENIZER_NAMES, OPENAI_TOKENIZERS):
-        ids = tokenizer.encode_ordinary_batch(contents)
-        for s in ids:
-            for id in s:
-                if id not in r[name]:
-                    r[name][id] = 0
-                r[name][id] += 1
-
-print(
-    json.dumps(
-        r,
-        indent=2,
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument(
+        "--num-shards",
+        type=int,
+        default=1,
+        help="Number of contiguous shards the dataset is counted in. The counts of "
+        f"each shard are saved under {OUTDIR}/shards/ and summed once all the "
+        "shards are counted.",
     )
-)
+    p.add_argument(
+        "--shard",
+        type=int,
+        action="append",
+        help="Count this shard, e.g. to spread the shards over several machines. "
+        "Can be repeated. Defaults to the shards that aren't counted yet.",
+    )
+    p.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Number of shards counted in parallel.",
+    )
+    args = p.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+    )
+
+    shards = args.shard or sorted(
+        set(range(args.num_shards)) - counted_shards(OUTDIR, args.num_shards)
+    )
+
+    if args.processes > 1:
+        with ProcessPoolExecutor(max_workers=args.processes) as executor:
+            for shard in executor.map(
+                count_shard, shards, [args.num_shards] * len(shards)
+            ):
+                logging.info(f"Counted shard {shard} of {args.num_shards}")
+    else:
+        for shard in shards:
+            count_shard(shard, args.num_shards)
+            logging.info(f"Counted shard {shard} of {args.num_shards}")
+
+    counted = counted_shards(OUTDIR, args.num_shards)
+    if len(counted) < args.num_shards:
+        logging.info(
+            f"Counted {len(counted)} of {args.num_shards} shards. Run again without "
+            "--shard once the others are counted to merge them."
+        )
+        raise SystemExit()
+
+    tokenizers = load_tokenizers()
+    r = merge_counts(OUTDIR, args.num_shards, tokenizers)
+
+    # Special tokens that never occur are left out, so that the zeros are the
+    # tokens of the vocabulary that never occur.
+    masked = {
+        name: mask_counts(*tokenizers[name], counts) for name, counts in r.items()
+    }
+
+    for name, counts in masked.items():
+        print(
+            f"{name}: {counts[counts > 0].sum()} tokens, "
+            f"{np.count_nonzero(counts > 0)} occurring, "
+            f"{np.count_nonzero(counts == 0)} never occurring"
+        )
 
-with open("results/token-frequencies.json", "w") as f:
-    json.dump(r, f, indent=2)
+    save_counts(OUTDIR, masked)
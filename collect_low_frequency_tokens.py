@@ -1,9 +1,12 @@
 import json
 import logging
 
+import numpy as np
 from tiktoken import encoding_for_model
 from transformers import AutoTokenizer
 
+from token_frequencies import load_counts
+
 HF_TOKENIZER_NAMES = [
     "replit/replit-code-v1_5-3b",
     "stabilityai/stable-code-3b",
@@ -26,22 +29,21 @@ OPENAI_TOKENIZERS = {
 
 
 # Step 1: Load the data
-with open("results/token-frequencies-zero-occurence.json", "r") as file:
-    data = json.load(file)
-
-# Sort the token frequencies in descending order
-for tokenizer_name, frequencies in data.items():
-    data[tokenizer_name] = {
-        k: v
-        for k, v in sorted(frequencies.items(), key=lambda item: item[1], reverse=True)
-    }
+data = load_counts(
+    "results/token-frequencies", HF_TOKENIZER_NAMES + OPENAI_TOKENIZER_NAMES
+)
 
 r = {}
 
-for tokenizer_name, frequencies in data.items():
+for tokenizer_name, counts in data.items():
     r[tokenizer_name] = []
 
-    for id, frequency in list(reversed(list(frequencies.items()))):
+    # The tokens that aren't left out, from the least to the most frequent
+    ids = np.flatnonzero(counts >= 0)
+    ids = ids[np.argsort(-counts[ids], kind="stable")][::-1]
+
+    for id in ids.tolist():
+        frequency = int(counts[id])
         token_str = None
 
         if tokenizer_name in HF_TOKENIZERS:
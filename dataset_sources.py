@@ -0,0 +1,162 @@
+"""
+Helpers to read evaluation corpora from local files and source trees, and to
+stream several datasets at once.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Marks an exhausted iterator.
+__EXHAUSTED = object()
+
+# The `datasets` builder of each supported extension of local data files.
+DATA_FILE_FORMATS = {
+    ".json": "json",
+    ".jsonl": "json",
+    ".parquet": "parquet",
+}
+
+# The language of each source file extension. Headers are parsed as C++.
+EXTENSION_LANGUAGES = {
+    ".c++": "c++",
+    ".cc": "c++",
+    ".cpp": "c++",
+    ".cxx": "c++",
+    ".h": "c++",
+    ".hh": "c++",
+    ".hpp": "c++",
+    ".hxx": "c++",
+    ".go": "go",
+    ".java": "java",
+    ".cjs": "javascript",
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".mjs": "javascript",
+    ".py": "python",
+    ".pyi": "python",
+}
+
+# Directories holding vendored, generated or tooling files, which don't reflect
+# the repository's own code.
+VENDORED_DIRS = {
+    ".git",
+    ".hg",
+    ".svn",
+    ".tox",
+    ".venv",
+    "__pycache__",
+    "bower_components",
+    "build",
+    "dist",
+    "node_modules",
+    "site-packages",
+    "third_party",
+    "vendor",
+    "venv",
+}
+
+# The number of bytes read from the start of a file to tell if it's binary.
+BINARY_SNIFF_SIZE = 8192
+
+
+@dataclass
+class SourceFile:
+    """A source file of a directory tree."""
+
+    # The path of the file relative to the root of the tree.
+    path: str
+
+    # The language of the file.
+    lang: str
+
+    # The size of the file in bytes.
+    size: int
+
+    # Why the file shouldn't be scored, if it shouldn't.
+    skip_reason: Optional[str] = None
+
+
+def walk_source_files(
+    root: str, max_bytes: int, exclude: Iterable[str] = ()
+) -> Iterator[SourceFile]:
+    """Yields the files of a directory tree in a supported language, sorted
+    within each directory, skipping the vendored directories and the
+    directories named in `exclude`. Minified, binary and files larger than
+    `max_bytes` are yielded with the reason they should be skipped."""
+    excluded = VENDORED_DIRS | set(exclude)
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if name not in excluded)
+
+        for name in sorted(filenames):
+            lang = EXTENSION_LANGUAGES.get(os.path.splitext(name)[1].lower())
+            path = os.path.join(dirpath, name)
+            if lang is None or not os.path.isfile(path):
+                continue
+
+            source_file = SourceFile(
+                path=os.path.relpath(path, root),
+                lang=lang,
+                size=os.path.getsize(path),
+            )
+
+            if source_file.size > max_bytes:
+                source_file.skip_reason = "large"
+            elif ".min." in name:
+                source_file.skip_reason = "minified"
+            else:
+                with open(path, "rb") as f:
+                    if b"\0" in f.read(BINARY_SNIFF_SIZE):
+                        source_file.skip_reason = "binary"
+
+            yield source_file
+
+
+def local_data_files(path: str) -> Tuple[str, List[str]]:
+    """Returns the `datasets` builder and the data files of a local corpus,
+    either a JSONL or Parquet file or a directory of them, searched
+    recursively."""
+    if os.path.isdir(path):
+        files = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(path)
+            for name in names
+            if os.path.splitext(name)[1] in DATA_FILE_FORMATS
+        )
+    else:
+        files = [path]
+
+    formats = {DATA_FILE_FORMATS.get(os.path.splitext(file)[1]) for file in files}
+    if not files or None in formats:
+        raise ValueError(
+            f"Expected JSONL or Parquet files in {path}, got {', '.join(files)}"
+        )
+    if len(formats) > 1:
+        raise ValueError(f"Can't mix JSONL and Parquet files in {path}")
+
+    return formats.pop(), files  # type: ignore
+
+
+def interleave(iterables: Iterable[Iterable[T]]) -> Iterator[T]:
+    """Yields an item of each iterable in turn until they are all exhausted.
+    Iterables are opened one per round, so the first items are yielded before
+    the later iterables are opened."""
+    active: List[Iterator[T]] = []
+    pending = iter(iterables)
+
+    while True:
+        opened = next(pending, None)
+        if opened is not None:
+            active.append(iter(opened))
+        elif not active:
+            return
+
+        for iterator in list(active):
+            item = next(iterator, __EXHAUSTED)
+            if item is __EXHAUSTED:
+                active.remove(iterator)
+            else:
+                yield item  # type: ignore
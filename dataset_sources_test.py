@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from dataset_sources import interleave, local_data_files, walk_source_files
+
+
+def test_local_data_files(tmp_path):
+    for name in ["b.jsonl", "a.jsonl", "nested/c.jsonl", "README.md"]:
+        os.makedirs(os.path.dirname(tmp_path / name), exist_ok=True)
+        (tmp_path / name).write_text("")
+
+    assert local_data_files(str(tmp_path)) == (
+        "json",
+        [str(tmp_path / name) for name in ["a.jsonl", "b.jsonl", "nested/c.jsonl"]],
+    )
+    assert local_data_files(str(tmp_path / "a.jsonl")) == (
+        "json",
+        [str(tmp_path / "a.jsonl")],
+    )
+
+    (tmp_path / "d.parquet").write_text("")
+    with pytest.raises(ValueError):
+        local_data_files(str(tmp_path))
+
+    with pytest.raises(ValueError):
+        local_data_files(str(tmp_path / "README.md"))
+
+
+def test_interleave():
+    opened = []
+
+    def shard(name, size):
+        opened.append(name)
+        for i in range(size):
+            yield f"{name}{i}"
+
+    items = interleave(
+        shard(name, size) for name, size in [("a", 3), ("b", 1), ("c", 2)]
+    )
+    assert next(items) == "a0"
+    # Later shards are only opened as the first ones are read.
+    assert opened == ["a"]
+    assert list(items) == ["a1", "b0", "a2", "c0", "c1"]
+
+
+def test_walk_source_files(tmp_path):
+    files = {
+        "main.py": b"print(1)\n",
+        "src/lib.cpp": b"int main() {}\n",
+        "src/README.md": b"# Readme\n",
+        "src/app.min.js": b"var a=1;\n",
+        "src/blob.go": b"package \0main\n",
+        "src/big.java": b"class A {}\n" * 100,
+        "node_modules/dep/index.js": b"module.exports = 1;\n",
+        "generated/out.js": b"var b = 2;\n",
+    }
+    for name, content in files.items():
+        os.makedirs(os.path.dirname(tmp_path / name), exist_ok=True)
+        (tmp_path / name).write_bytes(content)
+
+    found = {
+        source_file.path: (source_file.lang, source_file.skip_reason)
+        for source_file in walk_source_files(
+            str(tmp_path), max_bytes=1000, exclude=["generated"]
+        )
+    }
+    assert found == {
+        "main.py": ("python", None),
+        os.path.join("src", "lib.cpp"): ("c++", None),
+        os.path.join("src", "app.min.js"): ("javascript", "minified"),
+        os.path.join("src", "blob.go"): ("go", "binary"),
+        os.path.join("src", "big.java"): ("java", "large"),
+    }
@@ -0,0 +1,209 @@
+"""
+Score every source file of a local directory tree, e.g. a repository, across a
+pool of worker processes.
+
+Per-file metrics are written to <outdir>/<lang>/<tokenizer>/<name>/ as Parquet
+and their aggregates to <outdir>/<lang>/<tokenizer>/<name>.json, as with
+evaluate_the_stack.py and export_token_score.py. <outdir>/files/<name>.csv lists
+every file with what became of it.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+from collections import Counter
+from multiprocessing import cpu_count
+
+from tqdm import tqdm
+
+from aggregate import aggregate_metrics, find_metrics, iter_metrics
+from dataset_sources import walk_source_files
+from metrics_sink import MetricsSink
+from scoring import (
+    init_worker,
+    score_batches,
+    tokenizer_name,
+    tokenizer_spec,
+    worker_process,
+)
+from token_score import DEFAULT_TIMEOUT
+from worker_pool import WatchdogPool, WorkerTimeout, size_batches
+
+p = argparse.ArgumentParser()
+p.add_argument("lib", choices=["hf", "tiktoken"])
+p.add_argument("model")
+p.add_argument("root", help="The directory to score.")
+p.add_argument("outdir")
+p.add_argument(
+    "--tokenizer",
+    type=tokenizer_spec,
+    action="append",
+    default=[],
+    help="Another tokenizer to evaluate, as <hf|tiktoken>:<model>. Can be repeated.",
+)
+p.add_argument(
+    "--name",
+    help="The name of the results. Defaults to the name of the directory.",
+)
+p.add_argument(
+    "--exclude",
+    action="append",
+    default=[],
+    help="The name of a directory to skip, on top of the usual vendored and build "
+    "directories. Can be repeated.",
+)
+p.add_argument(
+    "--max-bytes",
+    type=int,
+    default=2**20,
+    help="Files larger than this, usually generated or data, are skipped.",
+)
+p.add_argument(
+    "--artefacts",
+    help="Directory of the syntax artefact store. Files are only parsed if their "
+    "artefacts aren't already stored by a previous run.",
+)
+p.add_argument(
+    "--batch-size",
+    type=int,
+    default=32,
+    help="Maximum number of files sent to a worker at once.",
+)
+p.add_argument(
+    "--batch-bytes",
+    type=int,
+    default=2**20,
+    help="Maximum size in bytes of a batch. Larger files are sent on their own.",
+)
+p.add_argument(
+    "--timeout",
+    type=float,
+    default=DEFAULT_TIMEOUT,
+    help="Seconds a file gets to be parsed, and to be scored for each tokenizer.",
+)
+p.add_argument(
+    "--worker-timeout",
+    type=float,
+    default=300,
+    help="Seconds after which a worker that hasn't finished a batch is killed and "
+    "replaced. The files of the batch are then retried one at a time.",
+)
+p.add_argument(
+    "--start-method",
+    choices=multiprocessing.get_all_start_methods(),
+    help="How worker processes are started. Defaults to the platform's default.",
+)
+
+if __name__ == "__main__":
+    args = p.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+    )
+
+    root = os.path.abspath(args.root)
+    name = args.name or os.path.basename(root)
+    tokenizer_specs = [(args.lib, args.model)] + args.tokenizer
+    tokenizer_names = sorted(
+        tokenizer_name(lib, model) for lib, model in tokenizer_specs
+    )
+
+    source_files = list(walk_source_files(root, args.max_bytes, args.exclude))
+    skipped = Counter(f.skip_reason for f in source_files if f.skip_reason)
+    logging.info(
+        f"Scoring {len(source_files) - sum(skipped.values())} files of {root} with "
+        f"{', '.join(tokenizer_names)}"
+        + "".join(f", skipping {count} {reason}" for reason, count in skipped.items())
+    )
+
+    os.makedirs(f"{args.outdir}/files", exist_ok=True)
+    files = open(f"{args.outdir}/files/{name}.csv", "w", newline="")
+    files_writer = csv.writer(files)
+    files_writer.writerow(["path", "lang", "total_bytes", "status"])
+
+    def write_file(path: str, lang: str, total_bytes: int, status: str):
+        files_writer.writerow([path, lang, total_bytes, status])
+
+    for source_file in source_files:
+        if source_file.skip_reason:
+            write_file(
+                source_file.path,
+                source_file.lang,
+                source_file.size,
+                f"skipped {source_file.skip_reason}",
+            )
+
+    # Files are scored largest first, so that the largest don't stall the end
+    # of the run, and read by the workers themselves.
+    tasks = size_batches(
+        sorted(
+            (
+                (f.path, f.lang, f.size, os.path.join(root, f.path))
+                for f in source_files
+                if not f.skip_reason
+            ),
+            key=lambda task: task[2],
+            reverse=True,
+        ),
+        size=lambda task: task[2],
+        max_items=args.batch_size,
+        max_size=args.batch_bytes,
+    )
+
+    with (
+        MetricsSink(args.outdir, name, tokenizer_names) as sink,
+        WatchdogPool(
+            worker_process,
+            cpu_count(),
+            args.worker_timeout,
+            initializer=init_worker,
+            initargs=(tokenizer_specs, [], args.artefacts, None, args.timeout),
+            context=multiprocessing.get_context(args.start_method),
+        ) as pool,
+    ):
+        progress = tqdm(total=len(source_files) - sum(skipped.values()))
+
+        for batch, results, e in score_batches(pool, tasks):
+            if results is None:
+                logging.error(f"Failed to compute token score: {e}")
+                status = "timeout" if isinstance(e, WorkerTimeout) else "failed"
+                for path, lang, size, _ in batch:
+                    write_file(path, lang, size, status)
+
+            else:
+                for result in results:
+                    if result.timeouts:
+                        status = "timeout"
+                    elif result.error is not None or not result.metrics:
+                        status = "failed"
+                    else:
+                        status = "scored"
+                    write_file(result.doc_id, result.lang, result.total_bytes, status)
+
+                    for tokenizer, metrics in result.metrics.items():
+                        sink.write(result.doc_id, result.lang, tokenizer, metrics)
+
+            progress.update(len(batch))
+
+        progress.close()
+
+    files.close()
+
+    for lang, model, dataset, path in find_metrics(args.outdir):
+        if dataset != name or model not in tokenizer_names:
+            continue
+
+        aggregate = aggregate_metrics(iter_metrics(path))
+        with open(os.path.join(args.outdir, lang, model, f"{name}.json"), "w") as o:
+            json.dump(aggregate, o)
+
+        print(
+            f"{lang} {model} ({aggregate['documents']} files): "
+            f"compression {aggregate['compression']:.2f}, "
+            f"identifier splitting score {aggregate['identifier_splitting_score']:.2f}, "
+            f"identifier fertility {aggregate['identifier_fertility']:.2f}, "
+            f"token span score {aggregate['token_span_score']:.2f}"
+        )
@@ -1,128 +1,421 @@
+import argparse
+import json
 import logging
+import multiprocessing
 import os
-import sys
-from multiprocessing import Pool, cpu_count
-from typing import Iterator, List, Optional, Tuple
+import time
+from multiprocessing import cpu_count
+from typing import Dict, Iterator, List, Set, TextIO, Union
 
-import tiktoken
-from datasets import Dataset, load_dataset
+import pyarrow as pa
+import pyarrow.compute as pc
+from datasets import Dataset, IterableDataset, load_dataset
+from datasets.table import Table
 from tqdm import tqdm
-from transformers import AutoTokenizer
 
+from arrow_documents import ArrowDocuments
+from dataset_sources import interleave, local_data_files
+from metrics_sink import MetricsSink
+from scoring import (
+    DocumentTask,
+    init_worker,
+    score_batches,
+    tokenizer_name,
+    tokenizer_spec,
+    worker_process,
+)
 from token_score import (
+    DEFAULT_TIMEOUT,
+    SPLIT_TABLE,
     SUPPORTED_LANGUAGES,
-    Document,
-    TokenScoreMetrics,
-    compute_token_score,
-    huggingface_tokenizer,
-    tiktoken_tokenizer,
+    load_split_table,
+    save_split_table,
 )
+from worker_pool import WatchdogPool, WorkerTimeout, size_batches
 
-if len(sys.argv) < 4:
-    print("Usage: python evaluate_the_stack.py <lib> <model> <dataset> <outdir>")
-    sys.exit(1)
-
-lib = sys.argv[1]
-model = sys.argv[2]
-dataset = sys.argv[3]
-outdir = sys.argv[4]
-
-assert lib in ["hf", "tiktoken"]
-assert dataset in ["bigcode/the-stack-smol", "bigcode/the-stack-smol-xs"]
+# The Hugging Face datasets that can be evaluated, split by language.
+HUB_DATASETS = ["bigcode/the-stack-smol", "bigcode/the-stack-smol-xs"]
 
-is_full_run = dataset == "bigcode/the-stack-smol"
 
-tokenizer = (
-    AutoTokenizer.from_pretrained(model, trust_remote_code=True)
-    if lib == "hf"
-    else tiktoken.encoding_for_model(model)
+p = argparse.ArgumentParser()
+p.add_argument("lib", choices=["hf", "tiktoken"])
+p.add_argument("model")
+p.add_argument(
+    "dataset",
+    help=f"{' or '.join(HUB_DATASETS)}, or a local JSONL or Parquet file, or a "
+    "directory of them, with content and lang columns.",
+)
+p.add_argument("outdir")
+p.add_argument(
+    "--tokenizer",
+    type=tokenizer_spec,
+    action="append",
+    default=[],
+    help="Another tokenizer to evaluate, as <hf|tiktoken>:<model>. Every document is "
+    "parsed once and scored against all the tokenizers. Can be repeated.",
+)
+p.add_argument(
+    "--split-table",
+    help="Precomputed split table to load authoritative identifier splits from. "
+    "It is created, or extended with the identifiers seen during the run, at the "
+    "end of the run.",
+)
+p.add_argument(
+    "--artefacts",
+    help="Directory of the syntax artefact store. Documents are only parsed if their "
+    "artefacts aren't already stored by a previous run.",
+)
+p.add_argument(
+    "--batch-size",
+    type=int,
+    default=32,
+    help="Maximum number of documents sent to a worker at once and tokenized as a "
+    "batch.",
+)
+p.add_argument(
+    "--batch-bytes",
+    type=int,
+    default=2**20,
+    help="Maximum size in bytes of a batch. Larger documents are sent on their own.",
+)
+p.add_argument(
+    "--schedule-window",
+    type=int,
+    default=4096,
+    help="Number of documents read ahead and scheduled largest first, so that large "
+    "documents don't stall the end of the run. 1 keeps the dataset order.",
+)
+p.add_argument(
+    "--timeout",
+    type=float,
+    default=DEFAULT_TIMEOUT,
+    help="Seconds a document gets to be parsed, and to be scored for each tokenizer.",
+)
+p.add_argument(
+    "--worker-timeout",
+    type=float,
+    default=300,
+    help="Seconds after which a worker that hasn't finished a batch is killed and "
+    "replaced. The documents of the batch are then retried one at a time.",
+)
+p.add_argument(
+    "--resume",
+    action="store_true",
+    help="Resume an interrupted run from its last checkpoint in outdir, skipping the "
+    "documents it already scored. Otherwise existing results are overwritten.",
+)
+p.add_argument(
+    "--checkpoint-interval",
+    type=float,
+    default=60,
+    help="Seconds between two checkpoints of the results.",
+)
+p.add_argument(
+    "--streaming",
+    action="store_true",
+    help="Stream the dataset rather than download and prepare it before scoring. "
+    "Languages are interleaved and read as they are scored, so scoring starts "
+    "right away and memory is bounded by --schedule-window.",
+)
+p.add_argument(
+    "--start-method",
+    choices=multiprocessing.get_all_start_methods(),
+    help="How worker processes are started. Workers load the tokenizers themselves, "
+    "so every method works. Defaults to the platform's default.",
 )
 
 
-def the_stack_to_documents(datasets: List[Dataset]) -> Iterator[Document]:
-    for ds in datasets:
-        for sample in ds:
-            lang = sample["lang"].lower()  # type: ignore
-
-            yield Document(
-                lang=lang,  # type: ignore
-                content=sample["content"].encode("utf-8", errors="ignore"),  # type: ignore
+def load_shards(
+    dataset: str, streaming: bool
+) -> List[Union[Dataset, IterableDataset]]:
+    """Loads a dataset as shards of documents, one per language for the Hugging
+    Face datasets."""
+    if os.path.exists(dataset):
+        builder, data_files = local_data_files(dataset)
+        return [
+            load_dataset(  # type: ignore
+                builder, data_files=data_files, split="train", streaming=streaming
             )
+        ]
 
+    assert dataset in HUB_DATASETS
 
-def worker_process(
-    doc: Document,
-) -> Tuple[Optional[TokenScoreMetrics], Optional[str], Optional[Exception]]:
-    try:
-        tokens = (
-            tiktoken_tokenizer(tokenizer, doc)  # type: ignore
-            if lib == "tiktoken"
-            else huggingface_tokenizer(tokenizer, doc)  # type: ignore
-        )
-        score = compute_token_score(
-            doc, tokens, return_token_span_score=not is_full_run
+    if dataset == "bigcode/the-stack-smol":
+        return [
+            load_dataset(  # type: ignore
+                dataset, data_dir=f"data/{lang}", split="train", streaming=streaming
+            )
+            for lang in SUPPORTED_LANGUAGES
+        ]
+
+    return [
+        load_dataset(  # type: ignore
+            dataset, lang, split="train", streaming=streaming, trust_remote_code=True
         )
-        return score.metrics, doc.lang, None
+        for lang in SUPPORTED_LANGUAGES
+    ]
+
+
+def doc_id(lang: str, row: int) -> str:
+    # Each language is a separate shard of the Hugging Face datasets, so rows are
+    # identified by their language and index.
+    return f"{lang}/{row}"
 
-    except Exception as e:
-        logging.error(f"Failed to compute token score: {e.__class__.__name__} {e}")
-        return None, None, e
+
+def arrow_tasks(
+    shards: List[Dataset], documents: ArrowDocuments
+) -> Iterator[DocumentTask]:
+    """Yields the documents of datasets held in Arrow tables by reference."""
+    for shard, ds in enumerate(shards):
+        langs = pc.utf8_lower(ds.data.table.column("lang")).to_pylist()
+        sizes = documents.sizes(shard).tolist()
+        for row, (lang, size) in enumerate(zip(langs, sizes)):
+            if lang in SUPPORTED_LANGUAGES:
+                yield doc_id(lang, row), lang, size, (shard, row)
+
+
+def supported_documents(shards: List[Dataset]) -> int:
+    """Returns the number of documents of datasets held in Arrow tables that
+    are in a supported language, which are those `arrow_tasks` yields."""
+    supported = pa.array(sorted(SUPPORTED_LANGUAGES))
+    return sum(
+        pc.sum(
+            pc.is_in(pc.utf8_lower(ds.data.table.column("lang")), value_set=supported)
+        ).as_py()
+        or 0
+        for ds in shards
+    )
+
+
+def streamed_tasks(shards: List[IterableDataset]) -> Iterator[DocumentTask]:
+    """Yields the documents of streamed datasets with their content,
+    interleaving the shards."""
+
+    def read_shard(ds: IterableDataset) -> Iterator[DocumentTask]:
+        for row, sample in enumerate(ds):
+            lang = sample["lang"].lower()
+            if lang in SUPPORTED_LANGUAGES:
+                content = sample["content"].encode("utf-8", errors="ignore")
+                yield doc_id(lang, row), lang, len(content), content
+
+    return interleave(read_shard(ds) for ds in shards)
 
 
 if __name__ == "__main__":
+    args = p.parse_args()
+
+    dataset = args.dataset
+    outdir = args.outdir
+
+    tokenizer_specs = [(args.lib, args.model)] + args.tokenizer
+    tokenizer_names = sorted(
+        tokenizer_name(lib, model) for lib, model in tokenizer_specs
+    )
+
     logging.basicConfig(
         level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
     )
 
-    logging.info(f"Computing token score for {lib}/{model} over {dataset}")
+    logging.info(
+        f"Computing token score for {', '.join(tokenizer_names)} over {dataset}"
+    )
 
-    if is_full_run:
-        logging.info("Omitting token span score for full run")
+    if args.split_table and os.path.exists(args.split_table):
+        # Loaded before the pool is created so that forked workers inherit it.
+        load_split_table(args.split_table)
+        logging.info(f"Loaded {len(SPLIT_TABLE)} identifier splits")
 
-    the_stack_smol = (
-        (
-            [
-                load_dataset(dataset, data_dir=f"data/{lang}", split="train")
-                for lang in SUPPORTED_LANGUAGES
-            ]
-        )
-        if is_full_run
-        else (
-            [
-                load_dataset(dataset, lang, split="train", trust_remote_code=True)
-                for lang in SUPPORTED_LANGUAGES
-            ]
+    split_table = dict(SPLIT_TABLE)
+    # The number of splits in the saved table. Splits are only ever added, so
+    # the table is only saved again once it has grown.
+    saved_splits = len(split_table)
+
+    shards = load_shards(dataset, args.streaming)
+
+    # Streamed documents are sent to workers with their content. Otherwise
+    # workers map the dataset's tables and tasks only reference their rows.
+    tables: List[Table] = []
+    if args.streaming:
+        total = None
+        all_tasks = streamed_tasks(shards)  # type: ignore
+    else:
+        total = supported_documents(shards)  # type: ignore
+        tables = [ds.data for ds in shards]  # type: ignore
+        all_tasks = arrow_tasks(
+            shards, ArrowDocuments([table.table for table in tables])  # type: ignore
         )
+
+    dataset_name = (
+        os.path.splitext(os.path.basename(os.path.normpath(dataset)))[0]
+        if os.path.exists(dataset)
+        else dataset.replace("/", "-")
     )
+    # The checkpoint and the timeouts of a run are kept per tokenizer set, so
+    # that runs of other tokenizers into the same outdir don't overwrite them.
+    # They sit directly under checkpoints/ and timeouts/, out of the
+    # <lang>/<tokenizer>/<dataset>.csv layout of metrics files.
+    run_name = f"{dataset_name}--{'+'.join(tokenizer_names)}"
+    checkpoint_file = f"{outdir}/checkpoints/{run_name}.json"
 
-    total = sum([len(ds) for ds in the_stack_smol])  # type: ignore
+    # The ids of the documents whose results were written, the committed
+    # metrics files and the size of the timeouts file at the last checkpoint.
+    completed: Set[str] = set()
+    committed_parts: List[str] = []
+    checkpointed_sizes: Dict[str, int] = {}
 
-    logging.info(f"Computing token score for {total} documents")
+    if args.resume and os.path.exists(checkpoint_file):
+        with open(checkpoint_file) as f:
+            checkpoint = json.load(f)
+        if checkpoint["tokenizers"] != tokenizer_names:
+            raise SystemExit(
+                f"Can't resume a run of {', '.join(checkpoint['tokenizers'])} with "
+                f"{', '.join(tokenizer_names)}"
+            )
+        completed = set(checkpoint["completed"])
+        committed_parts = checkpoint["parts"]
+        checkpointed_sizes = checkpoint["sizes"]
+        logging.info(f"Resuming from a checkpoint of {len(completed)} documents")
 
-    def outfile_for_lang(lang: str) -> str:
-        return f"{outdir}/{lang}/{lib}-{model.replace("/", "-")}/{dataset.replace("/", "-")}.csv"
+    def open_output(path: str, header: str) -> TextIO:
+        """Opens an output file, given relative to outdir. When resuming, rows
+        written after the last checkpoint are dropped since their documents are
+        scored again."""
+        full_path = os.path.join(outdir, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if path in checkpointed_sizes:
+            os.truncate(full_path, checkpointed_sizes[path])
+            return open(full_path, "a")
 
-    [
-        os.makedirs(os.path.dirname(outfile_for_lang(lang)), exist_ok=True)
-        for lang in SUPPORTED_LANGUAGES
-    ]
+        file = open(full_path, "w")
+        file.write(header)
+        return file
+
+    # Metrics are written to <outdir>/<lang>/<tokenizer>/<dataset>/ as Parquet.
+    sink = MetricsSink(
+        outdir, dataset_name, tokenizer_names, committed_parts=committed_parts
+    )
+
+    # Documents that timed out, kept to profile pathological inputs.
+    timeouts_path = f"timeouts/{run_name}.csv"
+    timeouts = open_output(timeouts_path, "doc_id,lang,total_bytes,stage\n")
+
+    def write_checkpoint():
+        """Commits the outputs and atomically records the documents they
+        hold."""
+        global saved_splits
+
+        parts = sink.commit()
+        timeouts.flush()
+
+        os.makedirs(os.path.dirname(checkpoint_file), exist_ok=True)
+        with open(f"{checkpoint_file}.tmp", "w") as f:
+            json.dump(
+                {
+                    "dataset": dataset,
+                    "tokenizers": tokenizer_names,
+                    "completed": sorted(completed),
+                    "parts": parts,
+                    "sizes": {timeouts_path: timeouts.tell()},
+                },
+                f,
+            )
+        os.replace(f"{checkpoint_file}.tmp", checkpoint_file)
+
+        if args.split_table and len(split_table) > saved_splits:
+            save_split_table(args.split_table, split_table)
+            saved_splits = len(split_table)
+
+    if total is not None:
+        logging.info(f"Computing token score for {total - len(completed)} documents")
 
-    files = {lang: open(outfile_for_lang(lang), "a") for lang in SUPPORTED_LANGUAGES}
+    with WatchdogPool(
+        worker_process,
+        cpu_count(),
+        args.worker_timeout,
+        initializer=init_worker,
+        initargs=(
+            tokenizer_specs,
+            tables,
+            args.artefacts,
+            args.split_table,
+            args.timeout,
+        ),
+        context=multiprocessing.get_context(args.start_method),
+    ) as pool:
+        for worker in pool.workers:
+            logging.info(
+                f"Worker {worker.process.pid} started in {worker.startup_seconds:.1f}s "
+                f"with a peak RSS of {worker.max_rss / 2**20:.0f} MB"
+            )
 
-    for file in files.values():
-        file.write(
-            "total_tokens,total_bytes,compression,token_span_score,raw_identifier_splitting_score,identifier_splitting_score,identifier_fertility\n"
+        tasks = size_batches(
+            (task for task in all_tasks if task[0] not in completed),
+            size=lambda task: task[2],
+            max_items=args.batch_size,
+            max_size=args.batch_bytes,
+            window=args.schedule_window,
         )
 
-    with Pool(cpu_count()) as pool:
-        tasks = (doc for doc in the_stack_to_documents(the_stack_smol))  # type: ignore
+        progress = tqdm(total=total, initial=len(completed))
+        last_checkpoint = time.monotonic()
+
+        # Documents and bytes scored by this run.
+        scored_docs = 0
+        scored_bytes = 0
 
-        for m, lang, e in tqdm(pool.imap_unordered(worker_process, tasks), total=total):
-            if e is not None:
+        for batch, results, e in score_batches(pool, tasks):
+            scored_docs += len(batch)
+            scored_bytes += sum(size for _, _, size, _ in batch)
+            progress.set_postfix_str(
+                f"{scored_bytes / 2**20 / (time.monotonic() - pool.started_at):.2f} MB/s",
+                refresh=False,
+            )
+
+            if results is None:
                 logging.error(f"Failed to compute token score: {e}")
-                continue
+                for task_id, lang, size, _ in batch:
+                    if isinstance(e, WorkerTimeout):
+                        timeouts.write(f"{task_id},{lang},{size},worker\n")
+                    completed.add(task_id)
+
+                progress.update(len(batch))
+
+            else:
+                for result in results:
+                    split_table.update(result.new_splits)
+
+                    for stage in result.timeouts:
+                        timeouts.write(
+                            f"{result.doc_id},{result.lang},{result.total_bytes},{stage}\n"
+                        )
+
+                    if result.error is not None:
+                        logging.error(f"Failed to compute token score: {result.error}")
+
+                    for name, metrics in result.metrics.items():
+                        sink.write(result.doc_id, result.lang, name, metrics)
 
-            if m is not None and lang is not None:
-                files[lang].write(
-                    f"{m.total_tokens},{m.total_bytes},{m.compression},{m.token_span_score},{m.raw_identifier_splitting_score},{m.identifier_splitting_score},{m.identifier_fertility}\n"
-                )
+                    completed.add(result.doc_id)
+
+                progress.update(len(results))
+
+            if time.monotonic() - last_checkpoint >= args.checkpoint_interval:
+                write_checkpoint()
+                last_checkpoint = time.monotonic()
+
+        progress.close()
+
+        elapsed = time.monotonic() - pool.started_at
+        logging.info(
+            f"Scored {scored_docs} documents ({scored_bytes / 2**20:.1f} MB) in "
+            f"{elapsed:.1f}s: {scored_docs / elapsed:.1f} docs/s, "
+            f"{scored_bytes / 2**20 / elapsed:.2f} MB/s, "
+            f"{pool.utilization():.0%} worker utilization"
+        )
+
+    write_checkpoint()
+
+    if args.split_table:
+        logging.info(
+            f"Saved {len(split_table)} identifier splits ({len(split_table) - len(SPLIT_TABLE)} new)"
+        )
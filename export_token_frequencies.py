@@ -1,17 +1,13 @@
-import json
-
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import seaborn as sns
 
+from token_frequencies import load_counts
+
 plt.rcParams.update({"font.size": 24})
 plt.rcParams["text.usetex"] = True  # TeX rendering
 
-# Load the data
-with open("results/token-frequencies-zero-occurence.json", "r") as file:
-    data = json.load(file)
-
 # Rename the tokenizers
 display_names = {
     "replit/replit-code-v1_5-3b": "Replit Code",
@@ -20,16 +16,20 @@ display_names = {
     "code-cushman-001": "Codex",
     "gpt-4": "GPT-4",
 }
-data = {
-    display_names[tokenizer_name]: frequencies
-    for tokenizer_name, frequencies in data.items()
-}
+
+# Load the data, keeping the frequencies of the tokens that aren't left out
+data = {}
+for tokenizer_name, counts in load_counts(
+    "results/token-frequencies", display_names
+).items():
+    ids = np.flatnonzero(counts >= 0)
+    data[display_names[tokenizer_name]] = pd.Series(counts[ids], index=ids)
 
 # Create the sum of frequencies for each tokenizer to obtain the total number of
 # tokens
 total = {}
 for tokenizer_name, frequencies in data.items():
-    total[tokenizer_name] = sum(frequencies.values())
+    total[tokenizer_name] = frequencies.sum()
 
 # Prepare a list for each tokenizer's data
 all_data = []
@@ -40,9 +40,7 @@ num_buckets = 30
 # Step 2: Process each tokenizer and calculate the average frequency per bucket
 for tokenizer_name, frequencies in data.items():
     # Convert the frequencies to a DataFrame
-    df = pd.DataFrame(
-        list(frequencies.values()), index=frequencies.keys(), columns=["Frequency"]
-    )
+    df = pd.DataFrame({"Frequency": frequencies})
     # Use qcut to create quantile-based buckets
     df["Bucket"], bins = pd.qcut(
         df["Frequency"],
@@ -0,0 +1,133 @@
+"""
+A columnar sink for the per-document metrics of an evaluation run.
+
+Metrics are written to Parquet with one directory per language and tokenizer,
+`<outdir>/<lang>/<model>/<dataset>/part-<n>.parquet`, which mirrors the layout of
+the CSV results and lets readers load a single partition's columns directly.
+"""
+
+import glob
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from token_score import TokenScoreMetrics
+
+# The columns of the metrics files: the document, then every field of
+# `TokenScoreMetrics`.
+SCHEMA = pa.schema(
+    [pa.field("doc_id", pa.string()), pa.field("lang", pa.string())]
+    + [
+        pa.field(name, pa.int64() if field.annotation is int else pa.float64())
+        for name, field in TokenScoreMetrics.model_fields.items()
+    ]
+)
+
+PART_PATTERN = re.compile(r"part-(\d+)\.parquet$")
+
+
+class MetricsSink:
+    """Buffers the metrics of documents scored with the tokenizers `models`
+    and writes them to Parquet as record batches of `batch_size` rows.
+
+    `commit` closes the open files, making everything written so far durable,
+    and returns the paths of all the committed files, relative to `outdir`. Rows
+    written afterwards go to new part files. A sink created with the parts of an
+    earlier commit picks up from there, deleting the parts that weren't
+    committed; otherwise existing parts are deleted. Only the partitions of
+    `models` are touched, so the results of other tokenizers are kept."""
+
+    def __init__(
+        self,
+        outdir: str,
+        dataset: str,
+        models: Iterable[str],
+        batch_size: int = 4096,
+        committed_parts: Optional[Iterable[str]] = None,
+    ):
+        self.outdir = outdir
+        self.dataset = dataset
+        self.models = set(models)
+        self.batch_size = batch_size
+
+        self.committed_parts = {
+            os.path.normpath(path) for path in committed_parts or []
+        }
+
+        # The number of the parts opened after the next commit. Part numbers are
+        # shared by all partitions.
+        self.generation = 0
+        for model in self.models:
+            for path in glob.glob(
+                os.path.join(outdir, "*", model, dataset, "part-*.parquet")
+            ):
+                if os.path.relpath(path, outdir) in self.committed_parts:
+                    match = PART_PATTERN.search(path)
+                    self.generation = max(self.generation, int(match.group(1)) + 1)  # type: ignore
+                else:
+                    os.remove(path)
+
+        self.buffers: Dict[Tuple[str, str], Dict[str, list]] = {}
+        self.writers: Dict[Tuple[str, str], pq.ParquetWriter] = {}
+
+    def path_for(self, lang: str, model: str) -> str:
+        """Returns the directory of the metrics of a language and tokenizer."""
+        return os.path.join(self.outdir, lang, model, self.dataset)
+
+    def write(self, doc_id: str, lang: str, model: str, metrics: TokenScoreMetrics):
+        """Adds the metrics of a document scored with a tokenizer."""
+        if model not in self.models:
+            raise ValueError(f"{model} isn't one of the sink's tokenizers")
+
+        buffer = self.buffers.get((lang, model))
+        if buffer is None:
+            buffer = self.buffers[(lang, model)] = {name: [] for name in SCHEMA.names}
+
+        buffer["doc_id"].append(doc_id)
+        buffer["lang"].append(lang)
+        for name, value in metrics:
+            buffer[name].append(value)
+
+        if len(buffer["doc_id"]) >= self.batch_size:
+            self.__flush(lang, model)
+
+    def commit(self) -> List[str]:
+        """Writes the buffered rows and closes the open files, returning the
+        paths of all the committed files relative to `outdir`."""
+        for lang, model in list(self.buffers):
+            self.__flush(lang, model)
+
+        for writer in self.writers.values():
+            writer.close()
+            self.committed_parts.add(os.path.relpath(writer.where, self.outdir))
+        self.writers = {}
+
+        self.generation += 1
+        return sorted(self.committed_parts)
+
+    def close(self):
+        self.commit()
+
+    def __enter__(self) -> "MetricsSink":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __flush(self, lang: str, model: str):
+        buffer = self.buffers.pop((lang, model))
+        if not buffer["doc_id"]:
+            return
+
+        writer = self.writers.get((lang, model))
+        if writer is None:
+            path = os.path.join(
+                self.path_for(lang, model), f"part-{self.generation:05d}.parquet"
+            )
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            writer = self.writers[(lang, model)] = pq.ParquetWriter(path, SCHEMA)
+
+        writer.write_batch(pa.RecordBatch.from_pydict(buffer, schema=SCHEMA))
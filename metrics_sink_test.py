@@ -0,0 +1,85 @@
+import glob
+import os
+
+import pyarrow.parquet as pq
+import pytest
+
+from metrics_sink import MetricsSink
+from token_score import TokenScoreMetrics
+
+
+def metrics(i: int) -> TokenScoreMetrics:
+    return TokenScoreMetrics(
+        compression=i / 2,
+        identifier_fertility=1.5,
+        identifier_splitting_score=0.5,
+        raw_identifier_splitting_score=0.25,
+        token_span_score=1.0,
+        total_tokens=i,
+        total_bytes=2 * i,
+    )
+
+
+def test_metrics_sink(tmp_path):
+    outdir = str(tmp_path)
+
+    sink = MetricsSink(outdir, "dataset", ["model"], batch_size=3)
+    for i in range(10):
+        sink.write(f"python/{i}", "python", "model", metrics(i))
+    parts = sink.commit()
+
+    # Rows written after the commit are lost when the run is interrupted.
+    for i in range(10, 20):
+        sink.write(f"python/{i}", "python", "model", metrics(i))
+    sink.buffers.clear()
+
+    with MetricsSink(outdir, "dataset", ["model"], committed_parts=parts) as sink:
+        for i in range(10, 20):
+            sink.write(f"python/{i}", "python", "model", metrics(i))
+        sink.write("go/0", "go", "model", metrics(0))
+
+    data = pq.read_table(sink.path_for("python", "model")).to_pydict()
+    assert sorted(data["doc_id"]) == sorted(f"python/{i}" for i in range(20))
+    assert sorted(data["total_tokens"]) == list(range(20))
+    assert set(data["lang"]) == {"python"}
+
+    assert pq.read_table(sink.path_for("go", "model")).num_rows == 1
+
+    # Without committed parts, existing results of the sink's tokenizers are
+    # overwritten.
+    MetricsSink(outdir, "dataset", ["model"]).close()
+    assert glob.glob(os.path.join(outdir, "**", "*.parquet"), recursive=True) == []
+
+
+def test_metrics_sink_keeps_other_models(tmp_path):
+    outdir = str(tmp_path)
+
+    with MetricsSink(outdir, "dataset", ["gpt-4", "cushman"]) as sink:
+        sink.write("python/0", "python", "gpt-4", metrics(1))
+        sink.write("python/0", "python", "cushman", metrics(2))
+
+    # A run of another tokenizer into the same results leaves them alone.
+    with MetricsSink(outdir, "dataset", ["gpt-3.5"]) as sink:
+        sink.write("python/0", "python", "gpt-3.5", metrics(3))
+        with pytest.raises(ValueError):
+            sink.write("python/0", "python", "gpt-4", metrics(3))
+
+    for model, tokens in [("gpt-4", 1), ("cushman", 2), ("gpt-3.5", 3)]:
+        data = pq.read_table(sink.path_for("python", model)).to_pydict()
+        assert data["total_tokens"] == [tokens]
+
+
+def test_metrics_sink_outdir_spelling(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    sink = MetricsSink("out", "dataset", ["model"])
+    sink.write("python/0", "python", "model", metrics(1))
+    parts = sink.commit()
+    sink.close()
+
+    # Parts are relative to the output directory, however it is spelled.
+    with MetricsSink("./out/", "dataset", ["model"], committed_parts=parts) as sink:
+        sink.write("python/1", "python", "model", metrics(2))
+
+    data = pq.read_table(sink.path_for("python", "model")).to_pydict()
+    assert sorted(data["doc_id"]) == ["python/0", "python/1"]
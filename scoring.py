@@ -0,0 +1,291 @@
+"""
+Scoring of documents against several tokenizers in a pool of worker processes,
+shared by the evaluation scripts.
+
+Each worker loads the tokenizers once in `init_worker` and scores batches of
+`DocumentTask`s with `worker_process`, parsing every document once for all the
+tokenizers.
+"""
+
+import argparse
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+import tiktoken
+from datasets.table import Table
+from transformers import AutoTokenizer
+
+from arrow_documents import ArrowDocuments
+from artefacts import ArtefactStore
+from token_score import (
+    DEFAULT_TIMEOUT,
+    SPLIT_TABLE,
+    Deadline,
+    Document,
+    TokenArray,
+    TokenScoreMetrics,
+    compute_syntax_artefacts,
+    compute_token_score,
+    huggingface_tokenizer,
+    huggingface_tokenizer_batch,
+    load_split_table,
+    tiktoken_tokenizer,
+    tiktoken_tokenizer_batch,
+)
+from worker_pool import WatchdogPool, WorkerDied, WorkerTimeout
+
+
+def tokenizer_spec(spec: str) -> Tuple[str, str]:
+    """Parses a tokenizer given as <lib>:<model>."""
+    lib, _, model = spec.partition(":")
+    if lib not in ["hf", "tiktoken"] or not model:
+        raise argparse.ArgumentTypeError(f"Expected <hf|tiktoken>:<model>, got {spec}")
+    return lib, model
+
+
+def tokenizer_name(lib: str, model: str) -> str:
+    """Returns the name of a tokenizer used in output paths."""
+    return f"{lib}-{model.replace('/', '-')}"
+
+
+def load_tokenizer(lib: str, model: str):
+    return (
+        AutoTokenizer.from_pretrained(model, trust_remote_code=True)
+        if lib == "hf"
+        else tiktoken.encoding_for_model(model)
+    )
+
+
+# The state of a worker process, set up by `init_worker`.
+
+# The tokenizers to evaluate, keyed by their name.
+tokenizers: Dict[str, Tuple[str, Any]] = {}
+
+# The documents of the dataset.
+documents: Optional[ArrowDocuments] = None
+
+artefact_store: Optional[ArtefactStore] = None
+
+# The seconds a document gets to be parsed, and to be scored for each tokenizer.
+document_timeout: float = DEFAULT_TIMEOUT
+
+# Whether authoritative splits are sent back to extend the split table.
+report_splits = False
+
+
+def init_worker(
+    tokenizer_specs: List[Tuple[str, str]],
+    tables: List[Table],
+    artefacts: Optional[str],
+    split_table: Optional[str],
+    timeout: float = DEFAULT_TIMEOUT,
+):
+    """Loads the tokenizers and opens the dataset in a new worker process."""
+    global tokenizers, documents, artefact_store, document_timeout, report_splits
+
+    tokenizers = {
+        tokenizer_name(lib, model): (lib, load_tokenizer(lib, model))
+        for lib, model in tokenizer_specs
+    }
+    # Memory-mapped tables are pickled as their path, so spawned workers map the
+    # same files as the parent.
+    documents = ArrowDocuments([table.table for table in tables])
+    artefact_store = ArtefactStore(artefacts) if artefacts else None
+    document_timeout = timeout
+    report_splits = split_table is not None
+
+    # Forked workers inherit the split table loaded by the parent.
+    if split_table and not SPLIT_TABLE and os.path.exists(split_table):
+        load_split_table(split_table)
+
+
+# A document sent to a worker: its id, language, size in bytes and either its
+# content, the path of a local file, or, for datasets held in memory-mapped
+# Arrow files, its shard and row. Workers read paths and rows themselves.
+DocumentTask = Tuple[str, str, int, Union[bytes, str, Tuple[int, int]]]
+
+
+# Identifiers whose authoritative splits this worker already sent back to the
+# parent to extend the split table.
+reported_identifiers: Set[str] = set()
+
+
+@dataclass
+class DocumentResult:
+    """The outcome of scoring a document against every tokenizer."""
+
+    # The id of the document.
+    doc_id: str
+
+    # The language of the document.
+    lang: str
+
+    # The size of the document in bytes.
+    total_bytes: int
+
+    # The metrics of each tokenizer that scored the document.
+    metrics: Dict[str, TokenScoreMetrics] = field(default_factory=dict)
+
+    # The authoritative splits to add to the split table.
+    new_splits: Dict[str, List[str]] = field(default_factory=dict)
+
+    # The stages that timed out, "parse" or the name of a tokenizer.
+    timeouts: List[str] = field(default_factory=list)
+
+    # The error that prevented scoring the document, if any.
+    error: Optional[Exception] = None
+
+
+def tokenize_batch(
+    lib: str, tokenizer, docs: List[Document]
+) -> List[Optional[TokenArray]]:
+    """Tokenizes a batch of documents. If the batch fails, documents are
+    tokenized one at a time so that a single bad document doesn't fail the
+    others."""
+    try:
+        return (
+            tiktoken_tokenizer_batch(tokenizer, docs)
+            if lib == "tiktoken"
+            else huggingface_tokenizer_batch(tokenizer, docs)
+        )
+    except Exception as e:
+        logging.warning(
+            f"Failed to tokenize a batch of {len(docs)} documents, retrying one at "
+            f"a time: {e.__class__.__name__} {e}"
+        )
+
+    batch_tokens = []
+    for doc in docs:
+        try:
+            batch_tokens.append(
+                tiktoken_tokenizer(tokenizer, doc)
+                if lib == "tiktoken"
+                else huggingface_tokenizer(tokenizer, doc)
+            )
+        except Exception as e:
+            logging.error(f"Failed to tokenize document: {e.__class__.__name__} {e}")
+            batch_tokens.append(None)
+
+    return batch_tokens
+
+
+def read_content(source: Union[bytes, str, Tuple[int, int]]) -> bytes:
+    """Returns the content of the document of a task."""
+    if isinstance(source, bytes):
+        return source
+
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read()
+
+    # Arrow strings are UTF-8, so the content is copied as is, once, from the
+    # view of the table's memory.
+    return bytes(documents.content(*source))  # type: ignore
+
+
+def worker_process(tasks: List[DocumentTask]) -> List[DocumentResult]:
+    """Scores a batch of documents against every tokenizer."""
+    docs = [
+        Document(id=task_id, lang=lang, content=read_content(source))  # type: ignore
+        for task_id, lang, _, source in tasks
+    ]
+
+    batch_tokens = {
+        name: tokenize_batch(lib, tokenizer, docs)
+        for name, (lib, tokenizer) in tokenizers.items()
+    }
+
+    return [
+        score_document(doc, {name: tokens[i] for name, tokens in batch_tokens.items()})
+        for i, doc in enumerate(docs)
+    ]
+
+
+def score_document(
+    doc: Document, doc_tokens: Dict[str, Optional[TokenArray]]
+) -> DocumentResult:
+    """Scores a document against the tokens of every tokenizer, parsing it
+    once."""
+    result = DocumentResult(
+        doc_id=doc.id, lang=doc.lang, total_bytes=len(doc.content)  # type: ignore
+    )
+
+    try:
+        deadline = Deadline(document_timeout)
+        artefacts = (
+            artefact_store.get_or_compute(doc, deadline)
+            if artefact_store
+            else compute_syntax_artefacts(doc, deadline=deadline)
+        )
+    except Exception as e:
+        logging.error(f"Failed to parse document: {e.__class__.__name__} {e}")
+        if isinstance(e, TimeoutError):
+            result.timeouts.append("parse")
+        result.error = e
+        return result
+
+    for name, tokens in doc_tokens.items():
+        if tokens is None:
+            continue
+
+        try:
+            score = compute_token_score(
+                doc,
+                tokens,
+                engine="numpy",
+                artefacts=artefacts,
+                deadline=Deadline(document_timeout),
+                return_identifier_splits=False,
+            )
+            result.metrics[name] = score.metrics
+
+        except TimeoutError as e:
+            logging.error(f"Timed out computing token score for {name}: {e}")
+            result.timeouts.append(name)
+
+        except Exception as e:
+            logging.error(
+                f"Failed to compute token score for {name}: {e.__class__.__name__} {e}"
+            )
+
+    if report_splits:
+        for identifier, authoritative_splits in zip(
+            artefacts.identifiers, artefacts.authoritative_splits
+        ):
+            if authoritative_splits is None:
+                continue
+            identifier_str = doc.token_to_string(identifier)
+            if (
+                identifier_str not in SPLIT_TABLE
+                and identifier_str not in reported_identifiers
+            ):
+                reported_identifiers.add(identifier_str)
+                result.new_splits[identifier_str] = authoritative_splits
+
+    return result
+
+
+def score_batches(
+    pool: WatchdogPool[List[DocumentTask], List[DocumentResult]],
+    batches: Iterable[List[DocumentTask]],
+) -> Iterator[
+    Tuple[List[DocumentTask], Optional[List[DocumentResult]], Optional[Exception]]
+]:
+    """Scores batches of documents in the pool, yielding each batch with its
+    results or the error it failed with. Batches whose worker got stuck or died
+    are retried one document at a time, so that only the document responsible
+    is lost."""
+    for batch, results, e in pool.imap_unordered(batches):
+        if (
+            results is None
+            and isinstance(e, (WorkerTimeout, WorkerDied))
+            and len(batch) > 1
+        ):
+            logging.warning(f"Retrying a batch of {len(batch)} documents: {e}")
+            for task in batch:
+                pool.submit([task])
+            continue
+
+        yield batch, results, e
@@ -0,0 +1,148 @@
+"""
+Counting how often each token of a tokenizer's vocabulary occurs in a corpus.
+
+Counts are kept as dense, vocabulary-sized `np.int64` arrays indexed by token id,
+accumulated a batch at a time with `np.bincount`, and saved as one `.npy` file
+per tokenizer. Saved counts are masked: special and added tokens that never
+occur are `ABSENT`, so that the tokens of the base vocabulary that never occur
+are the zeros.
+
+Corpora can be counted in shards, each saving its raw counts under
+`<outdir>/shards/`, which `merge_counts` sums once every shard is counted.
+"""
+
+import os
+import shutil
+from typing import Dict, Iterable, List, Sequence, Set
+
+import numpy as np
+
+# The count of the tokens left out of the frequencies.
+ABSENT = -1
+
+
+def vocabulary_size(lib: str, tokenizer) -> int:
+    """Returns one more than the largest token id of a tokenizer, including
+    the added and special tokens."""
+    if lib == "tiktoken":
+        return tokenizer.n_vocab
+    return max(len(tokenizer), tokenizer.vocab_size)
+
+
+def base_vocabulary_size(lib: str, tokenizer) -> int:
+    """Returns the number of tokens of a tokenizer's base vocabulary, without
+    the tokens added on top of it."""
+    if lib == "tiktoken":
+        return tokenizer.max_token_value + 1
+    return tokenizer.vocab_size
+
+
+def special_ids(lib: str, tokenizer) -> List[int]:
+    """Returns the ids of the special tokens of a tokenizer."""
+    if lib == "tiktoken":
+        return list(tokenizer._special_tokens.values())
+    return tokenizer.all_special_ids
+
+
+def mask_counts(lib: str, tokenizer, counts: np.ndarray) -> np.ndarray:
+    """Returns counts where the special tokens and the tokens outside the base
+    vocabulary that never occur are `ABSENT`."""
+    absent = np.zeros(len(counts), dtype=bool)
+    absent[base_vocabulary_size(lib, tokenizer) :] = True
+    absent[special_ids(lib, tokenizer)] = True
+
+    masked = counts.copy()
+    masked[absent & (counts == 0)] = ABSENT
+    return masked
+
+
+def encode_batch(lib: str, tokenizer, contents: List[str]) -> List[List[int]]:
+    """Encodes a batch of documents without adding special tokens."""
+    if lib == "tiktoken":
+        return tokenizer.encode_ordinary_batch(contents)
+    return tokenizer.batch_encode_plus(
+        contents, add_special_tokens=False, return_attention_mask=False
+    )["input_ids"]
+
+
+def count_tokens(counts: np.ndarray, batch_ids: Sequence[Sequence[int]]):
+    """Adds the occurrences of the token ids of a batch of documents to
+    `counts`."""
+    if not any(len(ids) for ids in batch_ids):
+        return
+
+    ids = np.concatenate([np.asarray(ids, dtype=np.int64) for ids in batch_ids])
+    batch_counts = np.bincount(ids, minlength=len(counts))
+    if len(batch_counts) > len(counts):
+        raise ValueError(
+            f"Token id {len(batch_counts) - 1} is out of the vocabulary of "
+            f"{len(counts)} tokens"
+        )
+    counts += batch_counts
+
+
+def counts_path(outdir: str, name: str) -> str:
+    """Returns the path of the counts of a tokenizer."""
+    return os.path.join(outdir, f"{name.replace('/', '-')}.npy")
+
+
+def save_counts(outdir: str, counts: Dict[str, np.ndarray]):
+    """Saves the counts of each tokenizer under `outdir`."""
+    os.makedirs(outdir, exist_ok=True)
+    for name, tokenizer_counts in counts.items():
+        np.save(counts_path(outdir, name), tokenizer_counts)
+
+
+def load_counts(outdir: str, names: Iterable[str]) -> Dict[str, np.ndarray]:
+    """Loads the counts of the given tokenizers saved under `outdir`."""
+    return {name: np.load(counts_path(outdir, name)) for name in names}
+
+
+def shard_dir(outdir: str, shard: int, num_shards: int) -> str:
+    """Returns the directory of the counts of a shard."""
+    return os.path.join(outdir, "shards", f"{shard:05d}-of-{num_shards:05d}")
+
+
+def save_shard_counts(
+    outdir: str, shard: int, num_shards: int, counts: Dict[str, np.ndarray]
+):
+    """Saves the counts of a shard. The shard's directory is only created once
+    all its counts are saved, so an interrupted shard is counted again."""
+    path = shard_dir(outdir, shard, num_shards)
+    shutil.rmtree(f"{path}.tmp", ignore_errors=True)
+    save_counts(f"{path}.tmp", counts)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def counted_shards(outdir: str, num_shards: int) -> Set[int]:
+    """Returns the shards whose counts are saved."""
+    return {
+        shard
+        for shard in range(num_shards)
+        if os.path.isdir(shard_dir(outdir, shard, num_shards))
+    }
+
+
+def merge_counts(
+    outdir: str, num_shards: int, names: Iterable[str]
+) -> Dict[str, np.ndarray]:
+    """Sums the counts of every shard."""
+    missing = set(range(num_shards)) - counted_shards(outdir, num_shards)
+    if missing:
+        raise FileNotFoundError(
+            f"Shards {', '.join(map(str, sorted(missing)))} of {num_shards} "
+            "aren't counted"
+        )
+
+    names = list(names)
+    merged: Dict[str, np.ndarray] = {}
+    for shard in range(num_shards):
+        for name, counts in load_counts(
+            shard_dir(outdir, shard, num_shards), names
+        ).items():
+            if name in merged:
+                merged[name] += counts
+            else:
+                merged[name] = counts
+    return merged
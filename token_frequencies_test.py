@@ -0,0 +1,74 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from token_frequencies import (
+    ABSENT,
+    count_tokens,
+    counted_shards,
+    load_counts,
+    mask_counts,
+    merge_counts,
+    save_counts,
+    save_shard_counts,
+)
+
+
+def test_count_tokens():
+    rng = np.random.default_rng(0)
+    batches = [
+        [rng.integers(0, 50, size=rng.integers(0, 100)).tolist() for _ in range(8)]
+        for _ in range(4)
+    ]
+
+    counts = np.zeros(50, dtype=np.int64)
+    expected: Counter = Counter()
+    for batch in batches + [[], [[], []]]:
+        count_tokens(counts, batch)
+        for ids in batch:
+            expected.update(ids)
+
+    assert {id: int(count) for id, count in enumerate(counts) if count} == expected
+
+    with pytest.raises(ValueError):
+        count_tokens(counts, [[50]])
+
+
+def test_save_counts(tmp_path):
+    counts = {"org/model": np.arange(5), "gpt-4": np.arange(3)}
+    save_counts(str(tmp_path), counts)
+
+    loaded = load_counts(str(tmp_path), counts)
+    assert {name: c.tolist() for name, c in loaded.items()} == {
+        name: c.tolist() for name, c in counts.items()
+    }
+
+
+class FakeTokenizer:
+    vocab_size = 6
+    all_special_ids = [0, 2]
+
+
+def test_mask_counts():
+    counts = np.array([0, 3, 5, 0, 1, 0, 0, 2])
+    masked = mask_counts("hf", FakeTokenizer(), counts)
+
+    # Special and added tokens that occur keep their counts.
+    assert masked.tolist() == [ABSENT, 3, 5, 0, 1, 0, ABSENT, 2]
+
+
+def test_merge_counts(tmp_path):
+    outdir = str(tmp_path)
+    save_shard_counts(outdir, 0, 3, {"gpt-4": np.array([1, 0, 2])})
+    save_shard_counts(outdir, 2, 3, {"gpt-4": np.array([0, 4, 1])})
+
+    assert counted_shards(outdir, 3) == {0, 2}
+    with pytest.raises(FileNotFoundError):
+        merge_counts(outdir, 3, ["gpt-4"])
+
+    save_shard_counts(outdir, 1, 3, {"gpt-4": np.array([5, 0, 0])})
+    # Counting a shard again replaces its counts.
+    save_shard_counts(outdir, 1, 3, {"gpt-4": np.array([3, 0, 0])})
+
+    assert merge_counts(outdir, 3, ["gpt-4"])["gpt-4"].tolist() == [4, 4, 3]
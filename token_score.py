@@ -1,20 +1,30 @@
 import functools
-import signal
+import json
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
-from typing import Dict, List, Set, Tuple
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence, Set, Tuple
 
+import numpy as np
 from pydantic import BaseModel
 from spiral import ronin
-from tiktoken import Encoding as OAIEncoding
-from transformers import BatchEncoding as HFEncoding
-from transformers import PreTrainedTokenizer, PreTrainedTokenizerFast
 from tree_sitter import Language as TSLanguage
-from tree_sitter import Node as TSNode
 from tree_sitter import Parser as TSParser
+from tree_sitter import Query as TSQuery
 from tree_sitter import Tree as TSTree
 from tree_sitter_languages import get_language as ts_get_language
 
-HFTokenizer = PreTrainedTokenizerFast | PreTrainedTokenizer
+# The tokenizer libraries are only needed by the callers that pass in a
+# tokenizer, and importing them is most of the cost of importing token_score.
+if TYPE_CHECKING:
+    from tiktoken import Encoding as OAIEncoding
+    from transformers import BatchEncoding as HFEncoding
+    from transformers import PreTrainedTokenizer, PreTrainedTokenizerFast
+
+    HFTokenizer = PreTrainedTokenizerFast | PreTrainedTokenizer
 
 # The set of languages supported by TokenScore.
 SUPPORTED_LANGUAGES = set(
@@ -27,6 +37,27 @@ SUPPORTED_LANGUAGES = set(
     ]
 )
 
+# The engines that can compute the metrics. The "python" engine scores tokens
+# one at a time while the "numpy" engine runs vectorized kernels over the
+# token offsets. Both produce identical results.
+ENGINES = set(["python", "numpy"])
+
+# The maximum number of identifiers whose authoritative splits are kept in the
+# in-memory LRU cache in front of ronin.
+SPLIT_CACHE_SIZE = 2**16
+
+# Precomputed authoritative splits keyed by identifier, consulted before the
+# LRU cache. Load it with `load_split_table` before starting worker processes
+# so that they share it.
+SPLIT_TABLE: Dict[str, List[str]] = {}
+
+# The number of seconds a document gets to be scored when no deadline is given.
+DEFAULT_TIMEOUT = 10
+
+# The number of tokens, syntax nodes or identifiers processed between two
+# deadline checks in the Python loops.
+DEADLINE_CHECK_INTERVAL = 2**12
+
 
 class Token(BaseModel):
     """A token is a byte range over a source code document"""
@@ -42,6 +73,145 @@ class SyntaxToken(Token):
     type: str
 
 
+class TokenArray:
+    """A compact, columnar sequence of tokens.
+
+    Byte ranges are stored as parallel `array("I")` columns of start and end
+    offsets and, for syntax tokens, types are stored as indices into a table of
+    interned type names. This is much cheaper to build and to pickle than one
+    `Token` per token. Indexing or iterating yields `Token` (or `SyntaxToken`)
+    views built on demand."""
+
+    def __init__(self, syntax: bool = False):
+        # The start and end byte offsets of the tokens.
+        self.starts: array | memoryview = array("I")
+        self.ends: array | memoryview = array("I")
+
+        # For syntax tokens, the index of each token's type in `type_names`.
+        self.types: Optional[array | memoryview] = array("H") if syntax else None
+        self.type_names: List[str] = []
+        self.type_ids: Dict[str, int] = {}
+
+    @classmethod
+    def from_columns(
+        cls,
+        starts: array | memoryview,
+        ends: array | memoryview,
+        types: Optional[array | memoryview] = None,
+        type_names: Optional[List[str]] = None,
+    ) -> "TokenArray":
+        """Builds a token array from existing columns. Columns can also be
+        read-only memoryviews, e.g. over a memory-mapped file, in which case
+        the token array can't be appended to."""
+        tokens = cls()
+        tokens.starts = starts
+        tokens.ends = ends
+        tokens.types = types
+        tokens.type_names = list(type_names or [])
+        tokens.type_ids = {name: i for i, name in enumerate(tokens.type_names)}
+        return tokens
+
+    @classmethod
+    def from_tokens(cls, tokens: Sequence[Token]) -> "TokenArray":
+        """Builds a token array from a sequence of tokens."""
+        token_array = cls(
+            syntax=len(tokens) != 0 and isinstance(tokens[0], SyntaxToken)
+        )
+        for token in tokens:
+            token_array.append(*token.range, getattr(token, "type", None))
+        return token_array
+
+    @property
+    def is_syntax(self) -> bool:
+        """Whether the tokens hold a syntax type."""
+        return self.types is not None
+
+    def append(self, start: int, end: int, type: Optional[str] = None):
+        """Appends a token spanning the byte range [start, end)."""
+        self.starts.append(start)
+        self.ends.append(end)
+
+        if self.types is not None:
+            type_id = self.type_ids.get(type)  # type: ignore
+            if type_id is None:
+                type_id = self.type_ids[type] = len(self.type_names)  # type: ignore
+                self.type_names.append(type)  # type: ignore
+            self.types.append(type_id)
+
+    def type_of(self, index: int) -> str:
+        """Returns the syntax type of the token at `index`."""
+        return self.type_names[self.types[index]]  # type: ignore
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return TokenArray.from_columns(
+                self.starts[index],
+                self.ends[index],
+                None if self.types is None else self.types[index],
+                self.type_names,
+            )
+
+        if self.types is None:
+            return Token.model_construct(range=(self.starts[index], self.ends[index]))
+
+        return SyntaxToken.model_construct(
+            range=(self.starts[index], self.ends[index]), type=self.type_of(index)
+        )
+
+    def __iter__(self) -> Iterator[Token]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (TokenArray, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"TokenArray({list(self)!r})"
+
+
+# Scoring functions accept tokens either as a token array or as a list.
+Tokens = TokenArray | List[Token]
+
+
+def as_token_array(tokens: Tokens) -> TokenArray:
+    """Returns the tokens as a token array, converting them if needed."""
+    if isinstance(tokens, TokenArray):
+        return tokens
+    return TokenArray.from_tokens(tokens)
+
+
+class Deadline:
+    """A wall-clock budget shared by the stages that score a document.
+
+    The scoring loops check the deadline as they go and raise a TimeoutError
+    once it has passed. Unlike a SIGALRM timer this works in any thread, nests,
+    and leaves the process's signal handlers alone."""
+
+    def __init__(self, seconds: Optional[float] = None):
+        # The monotonic time at which the deadline passes, if any.
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> Optional[float]:
+        """Returns the number of seconds left, if the deadline can pass."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """Whether the deadline has passed."""
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self):
+        """Raises a TimeoutError if the deadline has passed."""
+        if self.expired():
+            raise TimeoutError("Deadline exceeded")
+
+
 class Document(BaseModel):
     """A structure that holds the content of a source code file."""
 
@@ -51,9 +221,32 @@ class Document(BaseModel):
     # The content of the document.
     content: bytes
 
-    def parse(self) -> TSTree:
-        """Returns the AST of the document."""
-        return TS_PARSERS[self.lang].parse(self.content)
+    # An identifier of the document that is stable across runs, e.g. its
+    # position in the dataset.
+    id: Optional[str] = None
+
+    def parse(self, deadline: Optional[Deadline] = None) -> TSTree:
+        """Returns the AST of the document. Parsing is abandoned with a
+        TimeoutError if the deadline passes."""
+        parser = get_parser(self.lang)
+
+        # A timeout of 0 disables the parser's timeout.
+        remaining = deadline.remaining() if deadline is not None else None
+        if remaining == 0:
+            raise TimeoutError("Deadline exceeded")
+        parser.set_timeout_micros(
+            0 if remaining is None else max(1, int(remaining * 1e6))
+        )
+
+        try:
+            return parser.parse(self.content)
+        except ValueError:
+            # The parser keeps the state of an abandoned parse and would resume
+            # it on the next call.
+            parser.reset()
+            if deadline is not None and deadline.expired():
+                raise TimeoutError("Deadline exceeded while parsing")
+            raise
 
     def token_to_bytes(self, token: Token) -> bytes:
         """Returns the bytes of the token."""
@@ -110,54 +303,87 @@ class IdentifierSplits(BaseModel):
 
 
 @dataclass
-class TokenScore:
-    """All the artefacts produced when computing token score."""
+class SplitCacheStats:
+    """Hit/miss counters of the authoritative splits lookups."""
 
-    tree: TSTree
+    # Lookups answered by the precomputed split table.
+    table_hits: int
 
-    identifiers: List[SyntaxToken]
+    # Lookups answered by the LRU cache.
+    cache_hits: int
 
-    identifier_splits: List[IdentifierSplits]
+    # Lookups that ran ronin.
+    misses: int
 
-    syntax_tokens: List[SyntaxToken]
 
-    metrics: TokenScoreMetrics
+@dataclass
+class SyntaxArtefacts:
+    """The artefacts of a document that don't depend on the tokenizer, and
+    so can be computed once and reused across tokenizers."""
 
+    identifiers: TokenArray
 
-def timeout(seconds=5):
-    """A decorator that raises a TimeoutError if the decorated function takes
-    longer than `seconds` to run."""
+    syntax_tokens: TokenArray
 
-    def decorator(func):
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            def handle_timeout(signum, frame):
-                raise TimeoutError()
+    # The authoritative splits of each identifier, or None for identifiers
+    # that aren't valid UTF-8.
+    authoritative_splits: List[Optional[List[str]]]
 
-            signal.signal(signal.SIGALRM, handle_timeout)
-            signal.alarm(seconds)
-            result = func(*args, **kwargs)
-            signal.alarm(0)
-            return result
 
-        return wrapper
+@dataclass
+class TokenScore:
+    """All the artefacts produced when computing token score."""
 
-    return decorator
+    # The AST of the document, unless it was scored from precomputed syntax
+    # artefacts.
+    tree: Optional[TSTree]
 
+    identifiers: TokenArray
 
-@timeout(10)
-def compute_token_score(
-    document: Document, tokens: List[Token], return_token_span_score: bool = True
-) -> TokenScore:
-    """Computes the token score of document."""
+    identifier_splits: List[IdentifierSplits]
 
-    tree = document.parse()
+    syntax_tokens: TokenArray
 
-    identifiers = collect_identifiers(tree, document)
+    metrics: TokenScoreMetrics
 
-    syntax_tokens = []
-    if return_token_span_score:
-        syntax_tokens = collect_syntax_tokens(tree, document.content)
+
+def compute_token_score(
+    document: Document,
+    tokens: Tokens,
+    return_token_span_score: bool = True,
+    engine: str = "python",
+    artefacts: Optional[SyntaxArtefacts] = None,
+    deadline: Optional[Deadline] = None,
+    return_identifier_splits: bool = True,
+) -> TokenScore:
+    """Computes the token score of document. If the document's syntax
+    artefacts are given, the document isn't parsed again. Unless
+    `return_identifier_splits` is set, only the metrics of the identifiers are
+    computed and `TokenScore.identifier_splits` is empty. A TimeoutError is
+    raised if scoring doesn't finish before the deadline, which defaults to
+    `DEFAULT_TIMEOUT` seconds from now."""
+
+    __check_engine(engine)
+
+    if deadline is None:
+        deadline = Deadline(DEFAULT_TIMEOUT)
+
+    tokens = as_token_array(tokens)
+
+    tree = None
+    authoritative_splits = None
+    syntax_tokens = TokenArray(syntax=True)
+
+    if artefacts is not None:
+        identifiers = artefacts.identifiers
+        authoritative_splits = artefacts.authoritative_splits
+        if return_token_span_score:
+            syntax_tokens = artefacts.syntax_tokens
+    else:
+        tree = document.parse(deadline)
+        identifiers = collect_identifiers(tree, document)
+        if return_token_span_score:
+            syntax_tokens = collect_syntax_tokens(tree, document.content, deadline)
 
     compression = 0
     if len(tokens) != 0:
@@ -168,11 +394,21 @@ def compute_token_score(
         raw_identifier_splitting_score,
         identifier_fertility,
         identifier_splits,
-    ) = compute_identifier_splitting_score(document, identifiers, tokens)
+    ) = compute_identifier_splitting_score(
+        document,
+        identifiers,
+        tokens,
+        engine,
+        authoritative_splits,
+        deadline,
+        return_identifier_splits,
+    )
 
     token_span_score = 0
     if return_token_span_score:
-        token_span_score = compute_token_span_score(syntax_tokens, tokens)
+        token_span_score = compute_token_span_score(
+            syntax_tokens, tokens, engine, deadline
+        )
 
     return TokenScore(
         metrics=TokenScoreMetrics(
@@ -191,87 +427,244 @@ def compute_token_score(
     )
 
 
+def compute_syntax_artefacts(
+    document: Document,
+    tree: Optional[TSTree] = None,
+    deadline: Optional[Deadline] = None,
+) -> SyntaxArtefacts:
+    """Computes the tokenizer-independent artefacts of a document, parsing it
+    unless its AST is given. A TimeoutError is raised if they aren't computed
+    before the deadline, which defaults to `DEFAULT_TIMEOUT` seconds from
+    now."""
+
+    if deadline is None:
+        deadline = Deadline(DEFAULT_TIMEOUT)
+
+    if tree is None:
+        tree = document.parse(deadline)
+
+    identifiers = collect_identifiers(tree, document)
+
+    authoritative_splits = []
+    for start, end in zip(identifiers.starts, identifiers.ends):
+        deadline.check()
+        try:
+            identifier_str = document.content[start:end].decode("utf-8")
+        except UnicodeDecodeError:
+            authoritative_splits.append(None)
+            continue
+        authoritative_splits.append(split_identifier(identifier_str))
+
+    return SyntaxArtefacts(
+        identifiers=identifiers,
+        syntax_tokens=collect_syntax_tokens(tree, document.content, deadline),
+        authoritative_splits=authoritative_splits,
+    )
+
+
 def tokens_overlap(a: Token, b: Token) -> bool:
     """Returns true if the two tokens overlap."""
     return a.range[0] < b.range[1] and b.range[0] < a.range[1]
 
 
-def tiktoken_tokenizer(enc: OAIEncoding, document: Document) -> List[Token]:
-    ids = enc.encode_ordinary(document.content.decode("utf-8", errors="strict"))
-    tokens = []
+def tiktoken_tokenizer(enc: "OAIEncoding", document: Document) -> TokenArray:
+    """Tokenizes a document with tiktoken."""
+    decoded_document = document.content.decode("utf-8", errors="strict")
+    return __tiktoken_token_array(enc, enc.encode_ordinary(decoded_document))
 
-    offset = 0
-    for i in range(len(ids)):
-        b = enc.decode_single_token_bytes(ids[i])
-        tokens.append(Token(range=(offset, offset + len(b))))
-        offset += len(b)
 
-    return tokens
+def tiktoken_tokenizer_batch(
+    enc: "OAIEncoding", documents: List[Document], num_threads: int = 8
+) -> List[TokenArray]:
+    """Tokenizes a batch of documents with tiktoken's threaded batch
+    encoder."""
+    batch_ids = enc.encode_ordinary_batch(
+        [document.content.decode("utf-8", errors="strict") for document in documents],
+        num_threads=num_threads,
+    )
+    return [__tiktoken_token_array(enc, ids) for ids in batch_ids]
+
+
+def __tiktoken_token_array(enc: "OAIEncoding", ids: List[int]) -> TokenArray:
+    """Converts tiktoken ids to tokens over the document's bytes."""
+    lengths = tiktoken_token_lengths(enc)[np.asarray(ids, dtype=np.int64)]
+    ends = np.cumsum(lengths, dtype=np.uint32)
+    starts = ends - lengths
+
+    return TokenArray.from_columns(
+        array("I", starts.tobytes()), array("I", ends.tobytes())
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def tiktoken_token_lengths(enc: "OAIEncoding") -> np.ndarray:
+    """Returns the length in bytes of every token of the encoding, indexed by
+    token id. Ids that aren't assigned to a token have a length of 0."""
+    lengths = np.zeros(enc.n_vocab, dtype=np.uint32)
+    for i in range(enc.n_vocab):
+        try:
+            lengths[i] = len(enc.decode_single_token_bytes(i))
+        except KeyError:
+            pass
+    return lengths
 
 
-def huggingface_tokenizer(tokenizer: HFTokenizer, document: Document) -> List[Token]:
+def huggingface_tokenizer(tokenizer: "HFTokenizer", document: Document) -> TokenArray:
     decoded_document = document.content.decode("utf-8", errors="strict")
 
-    enc: HFEncoding = tokenizer.encode_plus(
+    enc: "HFEncoding" = tokenizer.encode_plus(
         decoded_document,
         return_offsets_mapping=True,
         add_special_tokens=False,
         truncation="do_not_truncate",
     )
 
-    byte_offset_mapping = []
-    last_char_offset = None
+    return __huggingface_token_array(
+        document, decoded_document, enc.offset_mapping, enc.input_ids
+    )
 
-    assert (
-        len(enc.offset_mapping) == len(enc.input_ids)
-    ), f"len offset mapping {len(enc.offset_mapping)} != len input_ids {len(enc.input_ids)}"
 
-    for char_start, char_end in enc.offset_mapping:
-        # Decode only the new part of the text to find the byte length
-        if last_char_offset != (char_start, char_end):
-            char_start = last_char_offset[1] if last_char_offset else 0
-            char_byte_length = len(
-                decoded_document[char_start:char_end].encode("utf-8")
-            )
-            last_char_offset = (char_start, char_end)
-        else:
-            char_byte_length = 0
+def huggingface_tokenizer_batch(
+    tokenizer: "HFTokenizer", documents: List[Document]
+) -> List[TokenArray]:
+    """Tokenizes a batch of documents, letting fast tokenizers encode the
+    batch in Rust."""
+    decoded_documents = [
+        document.content.decode("utf-8", errors="strict") for document in documents
+    ]
 
-        if byte_offset_mapping:
-            byte_start = byte_offset_mapping[-1][1]
-        else:
-            byte_start = 0
+    enc: "HFEncoding" = tokenizer.batch_encode_plus(
+        decoded_documents,
+        return_offsets_mapping=True,
+        add_special_tokens=False,
+        truncation="do_not_truncate",
+    )
+
+    return [
+        __huggingface_token_array(document, decoded_document, offset_mapping, ids)
+        for document, decoded_document, offset_mapping, ids in zip(
+            documents, decoded_documents, enc["offset_mapping"], enc["input_ids"]
+        )
+    ]
 
-        byte_end = byte_start + char_byte_length
 
-        byte_offset_mapping.append((byte_start, byte_end))
+def __huggingface_token_array(
+    document: Document,
+    decoded_document: str,
+    offset_mapping: List[Tuple[int, int]],
+    input_ids: List[int],
+) -> TokenArray:
+    """Converts the character offsets of Hugging Face tokens to tokens over
+    the document's bytes.
+
+    Tokens can share characters, e.g. byte-level tokens of a multi-byte
+    character all map to the character. Each token is given the bytes of the
+    characters between the end of the previous token and its own end, if any,
+    so that tokens stay contiguous and the bytes of a character belong to the
+    first token that covers it."""
+    assert len(offset_mapping) == len(
+        input_ids
+    ), f"len offset mapping {len(offset_mapping)} != len input_ids {len(input_ids)}"
+
+    char_ends = np.asarray(offset_mapping, dtype=np.int64).reshape(-1, 2)[:, 1]
+    char_ends = np.minimum(char_ends, len(decoded_document))
+    previous_char_ends = np.concatenate([[0], char_ends[:-1]])
+
+    byte_offsets = __char_to_byte_offsets(decoded_document)
+    lengths = np.where(
+        char_ends > previous_char_ends,
+        byte_offsets[char_ends] - byte_offsets[previous_char_ends],
+        0,
+    )
+    ends = np.cumsum(lengths, dtype=np.uint32)
+    starts = ends - lengths.astype(np.uint32)
 
-    # Convert byte_offset_mapping to a list of Token instances
-    tokens = [Token(range=offset) for offset in byte_offset_mapping]
+    tokens = TokenArray.from_columns(
+        array("I", starts.tobytes()), array("I", ends.tobytes())
+    )
 
     assert len(tokens) == len(
-        enc.input_ids
-    ), f"len tokens {len(tokens)} != len input_ids {len(enc.input_ids)}"
-    assert tokens[-1].range[1] == len(
+        input_ids
+    ), f"len tokens {len(tokens)} != len input_ids {len(input_ids)}"
+    assert tokens.ends[-1] == len(
         document.content
-    ), f"last token {tokens[-1].range[1]} end != len document {len(document.content)}"
+    ), f"last token {tokens.ends[-1]} end != len document {len(document.content)}"
 
     return tokens
 
 
+def __char_to_byte_offsets(text: str) -> np.ndarray:
+    """Returns the UTF-8 byte offset of every character of the text, plus the
+    length of the text in bytes."""
+    code_points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    char_lengths = (
+        1
+        + (code_points >= 0x80).astype(np.int64)
+        + (code_points >= 0x800)
+        + (code_points >= 0x10000)
+    )
+    return np.concatenate([[0], np.cumsum(char_lengths)])
+
+
 def compute_token_span_score(
-    syntax_tokens: List[SyntaxToken], tokens: List[Token]
+    syntax_tokens: Tokens,
+    tokens: Tokens,
+    engine: str = "python",
+    deadline: Optional[Deadline] = None,
 ) -> float:
-    """Computes the token span score of a document."""
+    """Computes the token span score of a document.
+
+    Syntax tokens are sorted and contiguous, so the syntax tokens that overlap
+    a given token form a single run. Its bounds are found by bisecting the
+    syntax tokens' start and end offsets, which makes the cost linearithmic in
+    the size of the document rather than quadratic."""
+
+    __check_engine(engine)
+
+    syntax_tokens = as_token_array(syntax_tokens)
+    tokens = as_token_array(tokens)
+
+    if engine == "numpy":
+        token_span_score_sum = int(
+            np.maximum(
+                0,
+                np.searchsorted(
+                    __as_numpy(syntax_tokens.starts), __as_numpy(tokens.ends), "left"
+                ).astype(np.int64)
+                - np.searchsorted(
+                    __as_numpy(syntax_tokens.ends), __as_numpy(tokens.starts), "right"
+                ),
+            ).sum()
+        )
+
+        token_span_score = 0
+        if len(tokens) != 0:
+            token_span_score = token_span_score_sum / len(tokens)
+
+        return token_span_score
+
+    # Bisecting a list is much faster than bisecting an array, whose items are
+    # boxed on every access.
+    syntax_token_starts = syntax_tokens.starts.tolist()
+    syntax_token_ends = syntax_tokens.ends.tolist()
 
     token_span_score_sum = 0
 
-    for token in tokens:
-        for syntax_token in syntax_tokens:
-            if tokens_overlap(token, syntax_token):
-                token_span_score_sum += 1
-            if token.range[1] < syntax_token.range[0]:
-                break
+    for block in range(0, len(tokens), DEADLINE_CHECK_INTERVAL):
+        if deadline is not None:
+            deadline.check()
+
+        for start, end in zip(
+            tokens.starts[block : block + DEADLINE_CHECK_INTERVAL],
+            tokens.ends[block : block + DEADLINE_CHECK_INTERVAL],
+        ):
+            # Syntax tokens that start before the token ends, minus those that
+            # end before the token starts.
+            token_span_score_sum += max(
+                0,
+                bisect_left(syntax_token_starts, end)
+                - bisect_right(syntax_token_ends, start),
+            )
 
     token_span_score = 0
     if len(tokens) != 0:
@@ -282,10 +675,28 @@ def compute_token_span_score(
 
 def compute_identifier_splitting_score(
     document: Document,
-    identifiers: List[SyntaxToken],
-    tokens: List[Token],
+    identifiers: Tokens,
+    tokens: Tokens,
+    engine: str = "python",
+    precomputed_splits: Optional[List[Optional[List[str]]]] = None,
+    deadline: Optional[Deadline] = None,
+    return_identifier_splits: bool = True,
 ) -> Tuple[float, float, float, List[IdentifierSplits]]:
-    """Computes the identifier splitting score of a document."""
+    """Computes the identifier splitting score of a document. The
+    authoritative splits of the identifiers are computed unless they are
+    precomputed, as in `SyntaxArtefacts.authoritative_splits`. Unless
+    `return_identifier_splits` is set, the returned list of splits is empty,
+    which lets the numpy engine skip building them."""
+
+    __check_engine(engine)
+
+    identifiers = as_token_array(identifiers)
+    tokens = as_token_array(tokens)
+
+    if engine == "numpy" and not return_identifier_splits:
+        return __identifier_splitting_metrics(
+            document.content, identifiers, tokens, precomputed_splits, deadline
+        ) + ([],)
 
     jaccard_similarity_count = 0
     jaccard_similarity_sum = 0
@@ -298,19 +709,46 @@ def compute_identifier_splitting_score(
 
     identifier_splits = []
 
-    for identifier in identifiers:
+    content = document.content
+    token_starts, token_ends = tokens.starts.tolist(), tokens.ends.tolist()
+
+    # Tokens are sorted and contiguous, so both the tokens that end within an
+    # identifier and the tokens that overlap it form runs. `firsts` holds the
+    # index of the first token of both runs, and `raw_lasts` and `lasts` the
+    # index one past their last token.
+    if engine == "numpy":
+        firsts, raw_lasts, lasts = (
+            np.searchsorted(
+                __as_numpy(tokens.ends), __as_numpy(identifiers.starts), "right"
+            ).tolist(),
+            np.searchsorted(
+                __as_numpy(tokens.ends), __as_numpy(identifiers.ends), "right"
+            ).tolist(),
+            np.searchsorted(
+                __as_numpy(tokens.starts), __as_numpy(identifiers.ends), "left"
+            ).tolist(),
+        )
+    else:
+        firsts = [bisect_right(token_ends, start) for start in identifiers.starts]
+        raw_lasts = [bisect_right(token_ends, end) for end in identifiers.ends]
+        lasts = [bisect_left(token_starts, end) for end in identifiers.ends]
+
+    for i, (identifier_start, identifier_end) in enumerate(
+        zip(identifiers.starts, identifiers.ends)
+    ):
+        if deadline is not None:
+            deadline.check()
+
         try:
             # This shouldn't happen as code identifiers are generally valid
             # UTF-8.
-            identifier_str = document.token_to_string(identifier)
+            identifier_str = content[identifier_start:identifier_end].decode("utf-8")
         except UnicodeDecodeError:
             continue
 
         raw_tokenizer_splits = [
-            document.token_to_bytes(token).decode("utf-8", errors="ignore")
-            for token in tokens
-            if identifier.range[0] < token.range[1]
-            and token.range[1] <= identifier.range[1]
+            content[token_starts[j] : token_ends[j]].decode("utf-8", errors="ignore")
+            for j in range(firsts[i], raw_lasts[i])
         ]
 
         identifier_fertility_count += 1
@@ -318,29 +756,28 @@ def compute_identifier_splitting_score(
 
         # Find all the tokens that span the identifier's byte range.
         tokenizer_splits = [
-            # We create a new token to ensure that, when considering the
-            # identifier "abc" in the snippet "let abc = 10;", the token
-            # "abc" is not polluted by any extra characters that would come
-            # after or before it.
+            # We clip the token to the identifier to ensure that, when
+            # considering the identifier "abc" in the snippet "let abc = 10;",
+            # the token "abc" is not polluted by any extra characters that
+            # would come after or before it.
             # The rationale for ignoring errors is that if a token is not valid
             # UTF-8 then it's by definition not a correct split.
-            document.token_to_bytes(
-                Token(
-                    range=(
-                        max(token.range[0], identifier.range[0]),
-                        min(token.range[1], identifier.range[1]),
-                    )
+            content[
+                max(token_starts[j], identifier_start) : min(
+                    token_ends[j], identifier_end
                 )
-            )
+            ]
             .decode("utf-8", errors="ignore")
             .replace("_", "")
-            for token in tokens
-            if tokens_overlap(token, identifier)
+            for j in range(firsts[i], lasts[i])
         ]
 
         tokenizer_splits = list(filter(None, tokenizer_splits))
 
-        authoritative_splits = ronin.split(identifier_str)
+        if precomputed_splits is not None:
+            authoritative_splits = precomputed_splits[i]
+        else:
+            authoritative_splits = split_identifier(identifier_str)
 
         jaccard_similarity_count += 1
         jaccard_similarity_sum += compute_jaccard_similarity_score(
@@ -352,14 +789,15 @@ def compute_identifier_splitting_score(
             set(raw_tokenizer_splits), set(authoritative_splits)
         )
 
-        identifier_splits.append(
-            IdentifierSplits(
-                identifier=identifier,
-                tokenizer_splits=tokenizer_splits,
-                raw_tokenizer_splits=raw_tokenizer_splits,
-                authoritative_splits=authoritative_splits,
+        if return_identifier_splits:
+            identifier_splits.append(
+                IdentifierSplits(
+                    identifier=identifiers[i],
+                    tokenizer_splits=tokenizer_splits,
+                    raw_tokenizer_splits=raw_tokenizer_splits,
+                    authoritative_splits=authoritative_splits,
+                )
             )
-        )
 
     jaccard = 0
     if jaccard_similarity_count != 0:
@@ -376,62 +814,212 @@ def compute_identifier_splitting_score(
     return jaccard, raw_jaccard, identifier_fertility, identifier_splits
 
 
-def collect_identifiers(tree: TSTree, document: Document) -> List[SyntaxToken]:
-    """Collects the identifiers of the AST and their byte ranges over the
-    document's content."""
+def __identifier_splitting_metrics(
+    content: bytes,
+    identifiers: TokenArray,
+    tokens: TokenArray,
+    precomputed_splits: Optional[List[Optional[List[str]]]],
+    deadline: Optional[Deadline],
+) -> Tuple[float, float, float]:
+    """Computes the metrics of `compute_identifier_splitting_score` with the
+    numpy engine, without building the splits of each identifier.
 
-    TS_LANGUAGES[document.lang].node_kind_for_id
+    The number of raw splits of an identifier is the length of the run of
+    tokens that end within it, so the fertility is summed over the runs found
+    by bisecting. Only the Jaccard similarities, which compare sets of
+    strings, are left to a Python loop."""
+    identifier_starts = __as_numpy(identifiers.starts)
+    identifier_ends = __as_numpy(identifiers.ends)
+    firsts = np.searchsorted(__as_numpy(tokens.ends), identifier_starts, "right")
+    raw_lasts = np.searchsorted(__as_numpy(tokens.ends), identifier_ends, "right")
+    lasts = np.searchsorted(__as_numpy(tokens.starts), identifier_ends, "left")
 
-    query = TS_LANGUAGES[document.lang].query(__TS_QUERIES[document.lang])
+    token_starts, token_ends = tokens.starts.tolist(), tokens.ends.tolist()
 
-    matches = query.captures(tree.root_node)
+    # Identifiers that aren't valid UTF-8 are left out of the metrics.
+    valid = np.ones(len(identifiers), dtype=bool)
 
-    identifiers = [
-        SyntaxToken(range=(match[0].start_byte, match[0].end_byte), type=match[0].type)
-        for match in matches
-    ]
+    jaccard_similarity_sum = 0
+    raw_jaccard_similarity_sum = 0
+
+    for i, (start, end, first, raw_last, last) in enumerate(
+        zip(
+            identifiers.starts,
+            identifiers.ends,
+            firsts.tolist(),
+            raw_lasts.tolist(),
+            lasts.tolist(),
+        )
+    ):
+        if deadline is not None and i % DEADLINE_CHECK_INTERVAL == 0:
+            deadline.check()
+
+        if precomputed_splits is not None:
+            authoritative_splits = precomputed_splits[i]
+        else:
+            try:
+                authoritative_splits = split_identifier(
+                    content[start:end].decode("utf-8")
+                )
+            except UnicodeDecodeError:
+                authoritative_splits = None
+
+        if authoritative_splits is None:
+            valid[i] = False
+            continue
+
+        raw_tokenizer_splits = {
+            content[token_starts[j] : token_ends[j]].decode("utf-8", errors="ignore")
+            for j in range(first, raw_last)
+        }
+
+        # Tokens are clipped to the identifier, as in
+        # `compute_identifier_splitting_score`.
+        tokenizer_splits = {
+            content[max(token_starts[j], start) : min(token_ends[j], end)]
+            .decode("utf-8", errors="ignore")
+            .replace("_", "")
+            for j in range(first, last)
+        }
+        tokenizer_splits.discard("")
+
+        authoritative = set(authoritative_splits)
+        jaccard_similarity_sum += compute_jaccard_similarity_score(
+            tokenizer_splits, authoritative
+        )
+        raw_jaccard_similarity_sum += compute_jaccard_similarity_score(
+            raw_tokenizer_splits, authoritative
+        )
+
+    count = int(valid.sum())
+    if count == 0:
+        return 0, 0, 0
+
+    identifier_fertility_sum = int((raw_lasts - firsts)[valid].sum())
+
+    return (
+        jaccard_similarity_sum / count,
+        raw_jaccard_similarity_sum / count,
+        identifier_fertility_sum / count,
+    )
+
+
+def collect_identifiers(tree: TSTree, document: Document) -> TokenArray:
+    """Collects the identifiers of the AST and their byte ranges over the
+    document's content."""
+    matches = get_query(document.lang).captures(tree.root_node)
+
+    identifiers = TokenArray(syntax=True)
+    for match in matches:
+        identifiers.append(match[0].start_byte, match[0].end_byte, match[0].type)
 
     return identifiers
 
 
-def collect_syntax_tokens(tree: TSTree, content: bytes) -> List[SyntaxToken]:
+def collect_syntax_tokens(
+    tree: TSTree, content: bytes, deadline: Optional[Deadline] = None
+) -> TokenArray:
     """Collects the leaf nodes of the AST and their byte ranges over the
     document's content."""
-    syntax_tokens = []
+    syntax_tokens = TokenArray(syntax=True)
 
-    prev_start_byte = 0
     prev_end_byte = 0
+    next_deadline_check = 0
+
+    # Walk the tree depth-first with a cursor rather than recursing through
+    # `node.children`, which builds a list of nodes at every level and hits the
+    # recursion limit on deeply nested documents.
+    cursor = tree.walk()
+    done = False
+    while not done:
+        if cursor.goto_first_child():
+            continue
 
-    def collect_tokens(node: TSNode):
-        nonlocal prev_start_byte, prev_end_byte
+        if deadline is not None and len(syntax_tokens) >= next_deadline_check:
+            deadline.check()
+            next_deadline_check += DEADLINE_CHECK_INTERVAL
 
-        if node.child_count == 0:
-            token_type = str(node.type)
-            token_range = (node.start_byte, node.end_byte)
+        node = cursor.node
+        if prev_end_byte != node.start_byte:
+            syntax_tokens.append(prev_end_byte, node.start_byte, "unknown")
 
-            if prev_end_byte != node.start_byte:
-                syntax_tokens.append(
-                    SyntaxToken(range=(prev_end_byte, node.start_byte), type="unknown")
-                )
+        syntax_tokens.append(node.start_byte, node.end_byte, str(node.type))
 
-            syntax_tokens.append(SyntaxToken(range=token_range, type=token_type))
-
-            prev_start_byte = node.start_byte
-            prev_end_byte = node.end_byte
-        else:
-            for child in node.children:
-                collect_tokens(child)
+        prev_end_byte = node.end_byte
 
-    collect_tokens(tree.root_node)
+        # Move on to the next leaf, climbing up until a node has a next sibling.
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                done = True
+                break
 
     if prev_end_byte < len(content):
-        syntax_tokens.append(
-            SyntaxToken(range=(prev_end_byte, len(content)), type="unknown")
-        )
+        syntax_tokens.append(prev_end_byte, len(content), "unknown")
 
     return syntax_tokens
 
 
+def split_identifier(identifier: str) -> List[str]:
+    """Returns the authoritative splits of an identifier.
+
+    Identifiers like `i` or `self` repeat millions of times across a dataset
+    and ronin is slow, so splits are looked up in the split table first, then
+    in a bounded LRU cache in front of ronin."""
+    global __SPLIT_TABLE_HITS
+
+    splits = SPLIT_TABLE.get(identifier)
+    if splits is not None:
+        __SPLIT_TABLE_HITS += 1
+        return list(splits)
+
+    return list(__ronin_split(identifier))
+
+
+def split_cache_stats() -> SplitCacheStats:
+    """Returns the hit/miss counters of `split_identifier` in this
+    process."""
+    info = __ronin_split.cache_info()
+    return SplitCacheStats(
+        table_hits=__SPLIT_TABLE_HITS, cache_hits=info.hits, misses=info.misses
+    )
+
+
+def load_split_table(path: str):
+    """Loads a precomputed split table into `SPLIT_TABLE`."""
+    with open(path, "r") as f:
+        SPLIT_TABLE.update(json.load(f))
+
+
+def save_split_table(path: str, table: Dict[str, List[str]]):
+    """Saves a split table mapping identifiers to their authoritative
+    splits. The table is written to a temporary file that then replaces `path`,
+    so an interrupted save leaves the previous table intact."""
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(table, f)
+    os.replace(f"{path}.tmp", path)
+
+
+@functools.lru_cache(maxsize=SPLIT_CACHE_SIZE)
+def __ronin_split(identifier: str) -> Tuple[str, ...]:
+    """Splits an identifier with ronin. Results are cached as tuples so that
+    callers can't mutate them."""
+    return tuple(ronin.split(identifier))
+
+
+__SPLIT_TABLE_HITS = 0
+
+
+def __check_engine(engine: str):
+    """Raises a ValueError if the engine is not supported."""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine}, expected one of {ENGINES}")
+
+
+def __as_numpy(column: array | memoryview) -> np.ndarray:
+    """Returns a zero-copy NumPy view over an offset column."""
+    return np.frombuffer(column, dtype=np.uint32)
+
+
 def compute_jaccard_similarity_score(set1: Set[str], set2: Set[str]) -> float:
     """Calculate the Jaccard Similarity between two sets of splits."""
     intersection = len(set1.intersection(set2))
@@ -443,26 +1031,34 @@ def compute_jaccard_similarity_score(set1: Set[str], set2: Set[str]) -> float:
     return intersection / union
 
 
-def __build_languages() -> Dict[str, TSLanguage]:
-    """Builds a mapping from language name to tree-sitter language."""
-    languages = {}
-    for lang in SUPPORTED_LANGUAGES:
-        languages[lang] = ts_get_language(__TREE_SITTER_LANGUAGE_SLUGS[lang])
-    return languages
+@functools.lru_cache(maxsize=None)
+def get_language(lang: str) -> TSLanguage:
+    """Returns the tree-sitter language, loading its grammar on first use."""
+    return ts_get_language(__TREE_SITTER_LANGUAGE_SLUGS[lang])
 
 
-def __build_parsers() -> Dict[str, TSParser]:
-    """Builds a TreeSitter parser for each language in the given list."""
+def get_parser(lang: str) -> TSParser:
+    """Returns the calling thread's tree-sitter parser for the language.
+    Parsers hold parsing state, so each thread gets its own, built on first
+    use and reused afterwards."""
+    parsers = getattr(__TS_PARSER_POOL, "parsers", None)
+    if parsers is None:
+        parsers = __TS_PARSER_POOL.parsers = {}
 
-    parsers = {}
-    for lang in SUPPORTED_LANGUAGES:
-        try:
-            parsers[lang] = TSParser()
-            parsers[lang].set_language(TS_LANGUAGES[lang])
-        except Exception as e:
-            print(f"Error building parser for {lang}: {e}")
+    parser = parsers.get(lang)
+    if parser is None:
+        parser = TSParser()
+        parser.set_language(get_language(lang))
+        parsers[lang] = parser
+
+    return parser
 
-    return parsers
+
+@functools.lru_cache(maxsize=None)
+def get_query(lang: str) -> TSQuery:
+    """Returns the compiled identifier query of the language. Compiled queries
+    are immutable, so they are shared between threads."""
+    return get_language(lang).query(__TS_QUERIES[lang])
 
 
 __TREE_SITTER_LANGUAGE_SLUGS = {
@@ -499,6 +1095,5 @@ __TS_QUERIES = {
     """,
 }
 
-TS_LANGUAGES = __build_languages()
-
-TS_PARSERS = __build_parsers()
+# Per-thread parsers, see `get_parser`.
+__TS_PARSER_POOL = threading.local()
@@ -1,13 +1,99 @@
+import os
+import pickle
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import pytest
+import tiktoken
 from spiral import ronin
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import PreTrainedTokenizerFast
 
 from token_score import (
+    SPLIT_TABLE,
+    Deadline,
     Document,
     SyntaxToken,
+    Token,
+    TokenArray,
     collect_identifiers,
     collect_syntax_tokens,
+    compute_identifier_splitting_score,
+    compute_syntax_artefacts,
     compute_jaccard_similarity_score,
+    compute_token_score,
+    compute_token_span_score,
+    get_parser,
+    get_query,
+    huggingface_tokenizer,
+    huggingface_tokenizer_batch,
+    load_split_table,
+    save_split_table,
+    split_cache_stats,
+    split_identifier,
+    tiktoken_token_lengths,
+    tiktoken_tokenizer,
+    tiktoken_tokenizer_batch,
+    tokens_overlap,
 )
 
+SNIPPETS = {
+    "c++": ".cpp",
+    "go": ".go",
+    "java": ".java",
+    "javascript": ".js",
+    "python": ".py",
+}
+
+
+def load_snippets() -> List[Document]:
+    """Loads the example documents under `snippets/`."""
+    documents = []
+    for lang, ext in SNIPPETS.items():
+        path = os.path.join(os.path.dirname(__file__), "snippets", ext)
+        with open(path, "rb") as f:
+            documents.append(Document(lang=lang, content=f.read()))
+    return documents
+
+
+def byte_level_tiktoken() -> tiktoken.Encoding:
+    """Returns a tiktoken encoding with one token per byte, which doesn't need
+    to be downloaded."""
+    return tiktoken.Encoding(
+        name="bytes",
+        pat_str=r"\S+|\s+",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={},
+    )
+
+
+def byte_level_huggingface() -> PreTrainedTokenizerFast:
+    """Returns a Hugging Face tokenizer with one token per byte, which doesn't
+    need to be downloaded. Tokens of multi-byte characters share the
+    character's offsets."""
+    alphabet = sorted(pre_tokenizers.ByteLevel.alphabet())
+    tokenizer = Tokenizer(
+        models.BPE(vocab={c: i for i, c in enumerate(alphabet)}, merges=[])
+    )
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer)
+
+
+def random_tokens(content: bytes, seed: int) -> List[Token]:
+    """Splits the content into random contiguous tokens, some of them empty,
+    in the way a real tokenizer would."""
+    rng = random.Random(seed)
+    tokens = []
+    offset = 0
+    while offset < len(content):
+        length = rng.choice([0, 1, 1, 2, 3, 4, 8])
+        end = min(offset + length, len(content))
+        tokens.append(Token(range=(offset, end)))
+        offset = end
+    return tokens
+
 
 def test_collect_syntax_tokens_go():
     document = Document(
@@ -388,3 +474,266 @@ def test_spiral_usage():
     assert ronin.split("snake_case") == ["snake", "case"]
     assert ronin.split("InvalidCamel_CaseName") == ["Invalid", "Camel", "Case", "Name"]
     assert ronin.split("a space") == ["a", "space"]
+
+
+def test_compute_token_span_score():
+    def reference_token_span_score(syntax_tokens, tokens):
+        token_span_score_sum = 0
+        for token in tokens:
+            for syntax_token in syntax_tokens:
+                if tokens_overlap(token, syntax_token):
+                    token_span_score_sum += 1
+                if token.range[1] < syntax_token.range[0]:
+                    break
+        return token_span_score_sum / len(tokens) if tokens else 0
+
+    assert compute_token_span_score([], []) == 0
+
+    for document in load_snippets():
+        syntax_tokens = list(collect_syntax_tokens(document.parse(), document.content))
+
+        for seed in range(10):
+            tokens = random_tokens(document.content, seed)
+            assert compute_token_span_score(
+                syntax_tokens, tokens
+            ) == reference_token_span_score(syntax_tokens, tokens)
+
+
+def test_compute_identifier_splitting_score():
+    for document in load_snippets():
+        identifiers = collect_identifiers(document.parse(), document)
+
+        for seed in range(10):
+            tokens = random_tokens(document.content, seed)
+
+            (
+                _,
+                _,
+                identifier_fertility,
+                identifier_splits,
+            ) = compute_identifier_splitting_score(document, identifiers, tokens)
+
+            assert len(identifier_splits) == len(identifiers)
+            assert identifier_fertility == sum(
+                len(splits.raw_tokenizer_splits) for splits in identifier_splits
+            ) / len(identifiers)
+
+            for identifier, splits in zip(identifiers, identifier_splits):
+                start, end = identifier.range
+
+                assert splits.identifier == identifier
+                assert splits.raw_tokenizer_splits == [
+                    document.token_to_bytes(token).decode("utf-8", errors="ignore")
+                    for token in tokens
+                    if start < token.range[1] and token.range[1] <= end
+                ]
+                assert splits.tokenizer_splits == [
+                    split
+                    for split in (
+                        document.content[
+                            max(token.range[0], start) : min(token.range[1], end)
+                        ]
+                        .decode("utf-8", errors="ignore")
+                        .replace("_", "")
+                        for token in tokens
+                        if tokens_overlap(token, identifier)
+                    )
+                    if split
+                ]
+
+
+def test_token_array():
+    tokens = [
+        SyntaxToken(range=(0, 3), type="identifier"),
+        SyntaxToken(range=(3, 4), type="unknown"),
+        SyntaxToken(range=(4, 7), type="identifier"),
+    ]
+
+    token_array = TokenArray.from_tokens(tokens)
+
+    assert token_array.is_syntax
+    assert len(token_array) == 3
+    assert token_array == tokens
+    assert token_array[1] == tokens[1]
+    assert token_array[1:] == tokens[1:]
+    assert list(token_array.starts) == [0, 3, 4]
+    assert list(token_array.ends) == [3, 4, 7]
+    assert token_array.type_names == ["identifier", "unknown"]
+    assert pickle.loads(pickle.dumps(token_array)) == tokens
+
+    plain_tokens = TokenArray.from_tokens([Token(range=(0, 1)), Token(range=(1, 1))])
+
+    assert not plain_tokens.is_syntax
+    assert plain_tokens == [Token(range=(0, 1)), Token(range=(1, 1))]
+
+
+def test_compute_token_score_engines():
+    for document in load_snippets():
+        for seed in range(10):
+            tokens = random_tokens(document.content, seed)
+
+            python_score = compute_token_score(document, tokens, engine="python")
+            numpy_score = compute_token_score(document, tokens, engine="numpy")
+
+            assert numpy_score.metrics == python_score.metrics
+            assert numpy_score.identifier_splits == python_score.identifier_splits
+
+            metrics_only = compute_token_score(
+                document, tokens, engine="numpy", return_identifier_splits=False
+            )
+
+            assert metrics_only.metrics == python_score.metrics
+            assert metrics_only.identifier_splits == []
+
+
+def test_split_identifier(tmp_path):
+    before = split_cache_stats()
+
+    assert split_identifier("getUtf8OctetsFromCache") == ronin.split(
+        "getUtf8OctetsFromCache"
+    )
+    assert split_identifier("getUtf8OctetsFromCache") == ronin.split(
+        "getUtf8OctetsFromCache"
+    )
+
+    after = split_cache_stats()
+
+    assert after.misses == before.misses + 1
+    assert after.cache_hits == before.cache_hits + 1
+
+    path = str(tmp_path / "splits.json")
+    save_split_table(path, {"fooBarTable": ["foo", "bar", "table"]})
+    assert not os.path.exists(f"{path}.tmp")
+
+    try:
+        load_split_table(path)
+
+        assert split_identifier("fooBarTable") == ["foo", "bar", "table"]
+        assert split_cache_stats().table_hits == after.table_hits + 1
+    finally:
+        SPLIT_TABLE.clear()
+
+
+def test_tokenizer_batch():
+    documents = load_snippets() + [
+        Document(lang="python", content='s = "héllo wörld 😀"\n'.encode())
+    ]
+
+    enc = byte_level_tiktoken()
+    assert tiktoken_tokenizer_batch(enc, documents) == [
+        tiktoken_tokenizer(enc, document) for document in documents
+    ]
+
+    tokenizer = byte_level_huggingface()
+    assert huggingface_tokenizer_batch(tokenizer, documents) == [
+        huggingface_tokenizer(tokenizer, document) for document in documents
+    ]
+
+    for tokens, document in zip(
+        huggingface_tokenizer_batch(tokenizer, documents), documents
+    ):
+        assert tokens.ends[-1] == len(document.content)
+
+
+def test_tiktoken_tokenizer():
+    # A few merges that span whitespace and newlines.
+    mergeable_ranks = {bytes([i]): i for i in range(256)}
+    for merge in [b"  ", b"    ", b"\n\n", b"re", b"ret", b"retu", b"retur"]:
+        mergeable_ranks[merge] = len(mergeable_ranks)
+    mergeable_ranks[b"return"] = len(mergeable_ranks)
+
+    # The pre-tokenization patterns of cl100k_base and p50k_base.
+    for pat_str in [
+        r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]++[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+""",
+        r"""'(?:[sdmt]|ll|ve|re)| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+    ]:
+        enc = tiktoken.Encoding(
+            name="test",
+            pat_str=pat_str,
+            mergeable_ranks=mergeable_ranks,
+            special_tokens={"<|endoftext|>": len(mergeable_ranks) + 1},
+        )
+
+        lengths = tiktoken_token_lengths(enc)
+        assert len(lengths) == enc.n_vocab
+        assert lengths[len(mergeable_ranks) - 1] == len(b"return")
+        assert lengths[len(mergeable_ranks)] == 0
+
+        for document in load_snippets():
+            tokens = tiktoken_tokenizer(enc, document)
+            assert tokens.ends[-1] == len(document.content)
+
+
+def test_huggingface_tokenizer_multi_byte_characters():
+    document = Document(lang="python", content="é😀a".encode())
+
+    # The byte-level tokens of a character share its offsets, the first of them
+    # gets all of its bytes.
+    tokens = huggingface_tokenizer(byte_level_huggingface(), document)
+    assert [token.range for token in tokens] == [
+        (0, 2),
+        (2, 2),
+        (2, 6),
+        (6, 6),
+        (6, 6),
+        (6, 6),
+        (6, 7),
+    ]
+
+
+def test_collect_syntax_tokens_deeply_nested():
+    depth = 10 * sys.getrecursionlimit()
+    content = b"x = " + b"[" * depth + b"1" + b"]" * depth + b";"
+    tree = Document(lang="javascript", content=content).parse()
+
+    syntax_tokens = collect_syntax_tokens(tree, content)
+    assert len(syntax_tokens) == 2 * depth + 6
+    assert syntax_tokens.ends[-1] == len(content)
+
+
+def test_parsers_per_thread():
+    assert get_parser("python") is get_parser("python")
+    assert get_query("python") is get_query("python")
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(get_parser, "python").result() is not get_parser(
+            "python"
+        )
+
+    def artefacts(document: Document):
+        tree = document.parse()
+        return (
+            collect_identifiers(tree, document),
+            collect_syntax_tokens(tree, document.content),
+        )
+
+    documents = load_snippets() * 8
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(executor.map(artefacts, documents)) == [
+            artefacts(document) for document in documents
+        ]
+
+
+def test_deadline():
+    document = load_snippets()[0]
+    tokens = random_tokens(document.content, seed=0)
+
+    with pytest.raises(TimeoutError):
+        compute_token_score(document, tokens, deadline=Deadline(0))
+
+    with pytest.raises(TimeoutError):
+        compute_syntax_artefacts(document, deadline=Deadline(0))
+
+    # Parsing a huge document is abandoned once the deadline passes, and the
+    # parser is still usable afterwards.
+    huge = Document(lang=document.lang, content=document.content * 10000)
+    with pytest.raises(TimeoutError):
+        huge.parse(Deadline(0.001))
+    assert document.parse().root_node.end_byte == len(document.content)
+
+    # Unlike a SIGALRM timer, deadlines work outside of the main thread.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert (
+            executor.submit(compute_token_score, document, tokens).result().metrics
+            == compute_token_score(document, tokens).metrics
+        )
@@ -0,0 +1,353 @@
+"""
+A process pool that kills and replaces workers that get stuck on a task.
+
+Scoring checks a deadline as it goes, but some stages, like tokenization, run
+in native code that can't be interrupted. `multiprocessing.Pool` never recovers
+from a worker that doesn't return, so here each worker has its own pipe and the
+parent kills any worker whose task runs past the pool's timeout.
+"""
+
+import multiprocessing
+import resource
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass
+from itertools import batched
+from multiprocessing.connection import Connection, wait
+from multiprocessing.context import BaseContext
+from typing import (
+    Callable,
+    Deque,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class WorkerTimeout(Exception):
+    """The worker running the task was killed for running past the timeout."""
+
+
+class WorkerDied(Exception):
+    """The worker running the task exited without returning a result, e.g.
+    because it ran out of memory."""
+
+
+@dataclass
+class Worker:
+    """A worker process and the task it is running."""
+
+    process: multiprocessing.Process
+
+    # The parent's end of the worker's pipe.
+    conn: Connection
+
+    # The task the worker is running, if any.
+    task: Optional[object] = None
+
+    # Whether the worker is still running the initializer. Tasks are only sent
+    # to workers that are done starting.
+    starting: bool = True
+
+    # The monotonic time at which the worker was sent its task, or was started.
+    started_at: float = 0.0
+
+    # The seconds the worker took to start and run the initializer.
+    startup_seconds: float = 0.0
+
+    # The peak resident set size of the worker in bytes once it started.
+    max_rss: int = 0
+
+
+def max_rss() -> int:
+    """Returns the peak resident set size of the process in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def run_worker(
+    func: Callable,
+    conn: Connection,
+    initializer: Optional[Callable] = None,
+    initargs: Sequence = (),
+):
+    """Runs the initializer, sending back the worker's peak RSS or the error it
+    failed with, then runs tasks received over the pipe until the pipe is
+    closed or a None task is received, sending back each task's result or
+    error."""
+    try:
+        if initializer is not None:
+            initializer(*initargs)
+        conn.send((max_rss(), None))
+    except Exception as e:
+        conn.send(
+            (0, RuntimeError(f"Worker initializer failed: {e.__class__.__name__} {e}"))
+        )
+        return
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+
+        try:
+            response = (func(task), None)
+        except Exception as e:
+            response = (None, e)
+
+        try:
+            conn.send(response)
+        except Exception as e:
+            # The result or the error can't be pickled.
+            conn.send((None, RuntimeError(f"{e.__class__.__name__} {e}")))
+
+
+class WatchdogPool(Generic[T, R]):
+    """A pool of worker processes that run `func` over tasks, killing and
+    replacing a worker when its task takes longer than `timeout` seconds.
+
+    As with `multiprocessing.Pool`, each worker calls `initializer(*initargs)`
+    when it starts, which is where per-process state such as tokenizers should
+    be loaded, and `context` sets the start method of the workers. The pool
+    waits for the workers to be initialized, raising the error of a failed
+    initializer.
+
+    Workers that replace killed ones start while the others keep running tasks.
+    `imap_unordered` raises the error of a replacement whose initializer fails,
+    or a WorkerDied if it takes longer than `timeout` seconds to start."""
+
+    def __init__(
+        self,
+        func: Callable[[T], R],
+        processes: int,
+        timeout: float,
+        initializer: Optional[Callable] = None,
+        initargs: Sequence = (),
+        context: Optional[BaseContext] = None,
+    ):
+        self.func = func
+        self.timeout = timeout
+        self.initializer = initializer
+        self.initargs = initargs
+        self.context = context or multiprocessing.get_context()
+
+        self.workers: List[Worker] = [self.__start_worker() for _ in range(processes)]
+        try:
+            self.__await_startup(self.workers)
+        except Exception:
+            for worker in self.workers:
+                worker.process.kill()
+                worker.process.join()
+                worker.conn.close()
+            raise
+
+        # The monotonic time at which the pool started, and the total time
+        # workers spent running tasks.
+        self.started_at = time.monotonic()
+        self.busy_seconds = 0.0
+
+        # Tasks submitted while iterating, run before the remaining tasks.
+        self.submitted: Deque[T] = deque()
+
+    def submit(self, task: T):
+        """Adds a task to the running `imap_unordered` call."""
+        self.submitted.append(task)
+
+    def imap_unordered(
+        self, tasks: Iterable[T]
+    ) -> Iterator[Tuple[T, Optional[R], Optional[Exception]]]:
+        """Runs the tasks, which can't be None, and yields each task with its
+        result or the error it failed with, in completion order. Tasks killed by
+        the watchdog fail with a WorkerTimeout."""
+        tasks = iter(tasks)
+        exhausted = False
+
+        while True:
+            for worker in self.workers:
+                if worker.starting or worker.task is not None:
+                    continue
+
+                if self.submitted:
+                    task = self.submitted.popleft()
+                else:
+                    task = None if exhausted else next(tasks, None)
+                    exhausted = task is None
+                if task is None:
+                    break
+
+                worker.task = task
+                worker.started_at = time.monotonic()
+                worker.conn.send(task)
+
+            busy = [worker for worker in self.workers if worker.task is not None]
+            starting = [worker for worker in self.workers if worker.starting]
+            # Starting workers are only waited for while there may be tasks left
+            # for them.
+            if not busy and (not starting or (exhausted and not self.submitted)):
+                return
+
+            first_deadline = (
+                min(worker.started_at for worker in busy + starting) + self.timeout
+            )
+            ready = wait(
+                [worker.conn for worker in busy + starting],
+                timeout=max(0.0, first_deadline - time.monotonic()),
+            )
+
+            for worker in starting:
+                if worker.conn in ready:
+                    self.__finish_startup(worker)
+                elif time.monotonic() - worker.started_at >= self.timeout:
+                    worker.process.kill()
+                    worker.process.join()
+                    raise WorkerDied(f"Worker didn't start within {self.timeout}s")
+
+            for worker in busy:
+                task = worker.task
+                elapsed = time.monotonic() - worker.started_at
+                if worker.conn in ready:
+                    self.busy_seconds += elapsed
+                    try:
+                        result, error = worker.conn.recv()
+                    except EOFError:
+                        self.__replace_worker(worker)
+                        yield task, None, WorkerDied(  # type: ignore
+                            f"Worker exited with code {worker.process.exitcode}"
+                        )
+                        continue
+
+                    worker.task = None
+                    yield task, result, error  # type: ignore
+
+                elif elapsed >= self.timeout:
+                    self.busy_seconds += elapsed
+                    self.__replace_worker(worker)
+                    yield task, None, WorkerTimeout(  # type: ignore
+                        f"Task took longer than {self.timeout}s"
+                    )
+
+    def utilization(self) -> float:
+        """Returns the fraction of the time since the pool started that workers
+        spent running tasks."""
+        elapsed = time.monotonic() - self.started_at
+        return self.busy_seconds / (elapsed * len(self.workers)) if elapsed else 0.0
+
+    def close(self):
+        """Stops the workers once they finish their tasks."""
+        for worker in self.workers:
+            try:
+                worker.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+
+        for worker in self.workers:
+            worker.process.join(timeout=self.timeout)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+            worker.conn.close()
+
+    def __enter__(self) -> "WatchdogPool[T, R]":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __start_worker(self) -> Worker:
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(  # type: ignore
+            target=run_worker,
+            args=(self.func, child_conn, self.initializer, self.initargs),
+            daemon=True,
+        )
+        started_at = time.monotonic()
+        process.start()
+        # Closing the parent's copy of the child's end lets the parent see an
+        # EOF if the worker dies.
+        child_conn.close()
+        return Worker(process=process, conn=parent_conn, started_at=started_at)
+
+    def __await_startup(self, workers: List[Worker]):
+        """Waits for workers to be initialized. The first workers may download
+        what the initializer loads, so they are waited for without a
+        timeout."""
+        starting = {worker.conn: worker for worker in workers}
+        while starting:
+            for conn in wait(list(starting)):
+                self.__finish_startup(starting.pop(conn))  # type: ignore
+
+    def __finish_startup(self, worker: Worker):
+        """Receives the startup message of an initialized worker, recording
+        its startup time and peak RSS, or raises the error it failed with."""
+        try:
+            rss, error = worker.conn.recv()
+        except EOFError:
+            worker.process.join()
+            raise WorkerDied(
+                f"Worker exited during startup with code {worker.process.exitcode}"
+            )
+        if error is not None:
+            raise error
+
+        worker.starting = False
+        worker.startup_seconds = time.monotonic() - worker.started_at
+        worker.max_rss = rss
+
+    def __replace_worker(self, worker: Worker):
+        """Kills a worker and starts a new one in its place, which gets tasks
+        once it's initialized."""
+        worker.process.kill()
+        worker.process.join()
+        worker.conn.close()
+
+        self.workers[self.workers.index(worker)] = self.__start_worker()
+
+
+def size_batches(
+    items: Iterable[T],
+    size: Callable[[T], int],
+    max_items: int,
+    max_size: int,
+    window: int = 1,
+) -> Iterator[List[T]]:
+    """Groups items into batches of at most `max_items` items and `max_size` in
+    total, except for items larger than `max_size`, which get a batch of their
+    own.
+
+    If `window` is more than 1, items are read `window` at a time and each
+    window is batched largest first, so that large items start early rather than
+    stalling the end of the run while the other workers are idle."""
+    if window > 1:
+        items = (
+            item
+            for window_items in batched(items, window)
+            for item in sorted(window_items, key=size, reverse=True)
+        )
+
+    batch: List[T] = []
+    batch_size = 0
+    for item in items:
+        item_size = size(item)
+        if batch and (len(batch) >= max_items or batch_size + item_size > max_size):
+            yield batch
+            batch = []
+            batch_size = 0
+
+        batch.append(item)
+        batch_size += item_size
+
+    if batch:
+        yield batch
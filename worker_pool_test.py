@@ -0,0 +1,153 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from worker_pool import WatchdogPool, WorkerDied, WorkerTimeout, size_batches
+
+
+def run_task(task):
+    kind, value = task
+    if kind == "sleep":
+        time.sleep(value)
+    elif kind == "raise":
+        raise ValueError(value)
+    elif kind == "exit":
+        os._exit(value)
+    return value
+
+
+def test_watchdog_pool():
+    tasks = [("ok", i) for i in range(8)] + [
+        ("sleep", 60),
+        ("raise", "bad input"),
+        ("exit", 3),
+    ]
+
+    with WatchdogPool(run_task, processes=2, timeout=1) as pool:
+        results = {
+            task: (result, error) for task, result, error in pool.imap_unordered(tasks)
+        }
+
+    assert [results[("ok", i)] for i in range(8)] == [(i, None) for i in range(8)]
+
+    result, error = results[("sleep", 60)]
+    assert result is None and isinstance(error, WorkerTimeout)
+
+    result, error = results[("raise", "bad input")]
+    assert result is None and isinstance(error, ValueError)
+
+    result, error = results[("exit", 3)]
+    assert result is None and isinstance(error, WorkerDied)
+
+
+def test_watchdog_pool_submit():
+    with WatchdogPool(run_task, processes=2, timeout=10) as pool:
+        results = []
+        for task, result, error in pool.imap_unordered([("ok", 1), ("ok", 2)]):
+            results.append(result)
+            # Tasks submitted while iterating run in the same iteration.
+            if result < 4:
+                pool.submit(("ok", result + 2))
+
+    assert sorted(results) == [1, 2, 3, 4, 5]
+
+
+# Set by the initializer in each worker.
+greeting = None
+
+
+def init_greeting(value):
+    global greeting
+    if value is None:
+        raise ValueError("no greeting")
+    greeting = value
+
+
+def read_greeting(task):
+    return greeting, task
+
+
+@pytest.mark.parametrize("method", ["fork", "spawn", "forkserver"])
+def test_watchdog_pool_initializer(method):
+    with WatchdogPool(
+        read_greeting,
+        processes=2,
+        timeout=10,
+        initializer=init_greeting,
+        initargs=("hello",),
+        context=multiprocessing.get_context(method),
+    ) as pool:
+        results = sorted(result for _, result, _ in pool.imap_unordered([1, 2, 3]))
+        assert all(worker.startup_seconds > 0 for worker in pool.workers)
+        assert all(worker.max_rss > 0 for worker in pool.workers)
+
+    assert results == [("hello", 1), ("hello", 2), ("hello", 3)]
+
+    with pytest.raises(RuntimeError, match="no greeting"):
+        WatchdogPool(read_greeting, 2, 10, initializer=init_greeting, initargs=(None,))
+
+
+def init_replacement(marker, seconds):
+    # Workers started once the marker exists, i.e. replacements, are slow to
+    # initialize.
+    if os.path.exists(marker):
+        time.sleep(seconds)
+
+
+def test_watchdog_pool_replacement(tmp_path):
+    marker = str(tmp_path / "marker")
+
+    with WatchdogPool(
+        run_task,
+        processes=2,
+        timeout=2,
+        initializer=init_replacement,
+        initargs=(marker, 1),
+    ) as pool:
+        open(marker, "w").close()
+        tasks = [("exit", 3)] + [("sleep", 0.2)] * 8 + [("ok", 1)]
+
+        results = []
+        for _, _, error in pool.imap_unordered(tasks):
+            starting = any(worker.starting for worker in pool.workers)
+            results.append((error, starting))
+
+        # The other worker keeps running tasks while the replacement starts.
+        assert isinstance(results[0][0], WorkerDied)
+        assert [error for error, _ in results[1:]] == [None] * 9
+        assert any(starting for _, starting in results[1:])
+        assert not any(worker.starting for worker in pool.workers)
+
+    os.remove(marker)
+    with WatchdogPool(
+        run_task,
+        processes=1,
+        timeout=1,
+        initializer=init_replacement,
+        initargs=(marker, 60),
+    ) as pool:
+        open(marker, "w").close()
+        results = pool.imap_unordered([("exit", 3), ("ok", 1)])
+
+        _, _, error = next(results)
+        assert isinstance(error, WorkerDied)
+        with pytest.raises(WorkerDied, match="didn't start"):
+            next(results)
+
+
+def test_size_batches():
+    sizes = [1, 50, 2, 3, 200, 4, 5, 6, 7, 8]
+
+    batches = list(size_batches(sizes, lambda x: x, max_items=3, max_size=20))
+    assert batches == [[1], [50], [2, 3], [200], [4, 5, 6], [7, 8]]
+
+    # Largest first within each window.
+    batches = list(size_batches(sizes, lambda x: x, max_items=3, max_size=20, window=4))
+    assert batches == [[50], [3, 2, 1], [200], [6, 5, 4], [8, 7]]
+
+    batches = list(
+        size_batches(sizes, lambda x: x, max_items=3, max_size=20, window=10)
+    )
+    assert batches == [[200], [50], [8, 7], [6, 5, 4], [3, 2, 1]]